@@ -0,0 +1,9 @@
+"""ASGI config for core project."""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+
+application = get_asgi_application()
\ No newline at end of file
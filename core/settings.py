@@ -39,6 +39,7 @@ DJANGO_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'django.contrib.sites',
+    'django.contrib.postgres',
 ]
 
 THIRD_PARTY_APPS = [
@@ -93,6 +94,10 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'core.wsgi.application'
+ASGI_APPLICATION = 'core.asgi.application'
+
+# Route the chat endpoint to the async view (use with an ASGI server such as uvicorn)
+ASYNC_CHAT = env.bool('ASYNC_CHAT', default=False)
 
 # Database
 DATABASES = {
@@ -175,6 +180,21 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
+CELERY_TASK_DEFAULT_QUEUE = 'celery'
+CELERY_TASK_ROUTES = ('documents.queues.route_task',)
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1  # long ingestion tasks are not reserved by a worker that is already busy
+# Unacknowledged (acks_late) tasks are redelivered after this; it must outlast the longest ingestion
+CELERY_BROKER_TRANSPORT_OPTIONS = {'visibility_timeout': env.int('CELERY_VISIBILITY_TIMEOUT', default=60 * 60 * 6)}
+CELERY_BEAT_SCHEDULE = {
+    'reconcile-vectors': {
+        'task': 'documents.tasks.reconcile_vectors',
+        'schedule': 60 * 60 * 24,  # daily
+    },
+    'retry-vector-deletions': {
+        'task': 'documents.tasks.retry_vector_deletions',
+        'schedule': 60 * 5,
+    },
+}
 
 # Redis settings
 CACHES = {
@@ -187,6 +207,52 @@ CACHES = {
     }
 }
 
+# Retrieval settings
+RETRIEVAL_MODE = env('RETRIEVAL_MODE', default='hybrid')  # 'dense' or 'hybrid' (dense + full-text)
+HYBRID_CANDIDATES = env.int('HYBRID_CANDIDATES', default=20)  # hits taken from each retriever before fusion
+RRF_K = env.int('RRF_K', default=60)  # reciprocal rank fusion constant
+
+# Embedding cache settings
+EMBEDDING_CACHE_ALIAS = 'default'
+EMBEDDING_CACHE_TTL = env.int('EMBEDDING_CACHE_TTL', default=60 * 60 * 24 * 30)  # 30 days
+EMBEDDING_CACHE_DISK_PATH = env('EMBEDDING_CACHE_DISK_PATH', default=None)  # optional local SQLite tier
+EMBEDDING_CACHE_DISK_MAX_ENTRIES = env.int('EMBEDDING_CACHE_DISK_MAX_ENTRIES', default=100000)
+
+# Lifetime of the per-document version keys that retrieval and answer cache keys embed
+CACHE_VERSION_TTL = env.int('CACHE_VERSION_TTL', default=60 * 60 * 24 * 30)  # 30 days
+
+# Retrieval result cache settings
+RETRIEVAL_CACHE_ALIAS = 'default'
+RETRIEVAL_CACHE_TTL = env.int('RETRIEVAL_CACHE_TTL', default=60 * 5)  # 5 minutes
+RETRIEVAL_CACHE_LOCK_TIMEOUT = env.int('RETRIEVAL_CACHE_LOCK_TIMEOUT', default=10)  # seconds
+RETRIEVAL_CACHE_WAIT = env.float('RETRIEVAL_CACHE_WAIT', default=2.0)  # max seconds to wait for a concurrent retrieval
+
+# Semantic answer cache settings
+ANSWER_CACHE_ALIAS = 'default'
+ANSWER_CACHE_TTL = env.int('ANSWER_CACHE_TTL', default=60 * 60 * 24)  # 1 day
+ANSWER_CACHE_THRESHOLD = env.float('ANSWER_CACHE_THRESHOLD', default=0.95)  # min cosine similarity of questions
+ANSWER_CACHE_MAX_ENTRIES = env.int('ANSWER_CACHE_MAX_ENTRIES', default=64)  # answers kept per document
+
+METRICS_ENABLED = env.bool('METRICS_ENABLED', default=True)
+# Chat prompt settings (token counts are cl100k estimates)
+PROMPT_MAX_TOKENS = env.int('PROMPT_MAX_TOKENS', default=2048)  # prompt budget per turn, excluding the completion
+PROMPT_HISTORY_TOKENS = env.int('PROMPT_HISTORY_TOKENS', default=512)  # of which earlier conversation turns
+PROMPT_HISTORY_MESSAGES = env.int('PROMPT_HISTORY_MESSAGES', default=10)  # most recent messages considered
+PROMPT_CANDIDATE_CHUNKS = env.int('PROMPT_CANDIDATE_CHUNKS', default=6)  # retrieved chunks offered to the prompt
+PROMPT_DEDUP_OVERLAP = env.float('PROMPT_DEDUP_OVERLAP', default=0.5)  # skip chunks this much contained in another
+PROMPT_MIN_CHUNK_TOKENS = env.int('PROMPT_MIN_CHUNK_TOKENS', default=64)  # smallest truncated text worth sending
+
+# Batch chat settings
+CHAT_BATCH_MAX_QUESTIONS = env.int('CHAT_BATCH_MAX_QUESTIONS', default=50)  # questions accepted per batch request
+CHAT_BATCH_CONCURRENCY = env.int('CHAT_BATCH_CONCURRENCY', default=8)  # LLM requests in flight per batch
+
+# Library retrieval settings (conversations over all of a user's documents)
+LIBRARY_MAX_DOCUMENTS = env.int('LIBRARY_MAX_DOCUMENTS', default=4)  # documents contributing context per question
+LIBRARY_CHUNKS_PER_DOCUMENT = env.int('LIBRARY_CHUNKS_PER_DOCUMENT', default=2)  # best chunks taken from each
+
+# Metrics endpoint; when set, scrapers must send "Authorization: Bearer <token>"
+METRICS_TOKEN = env('METRICS_TOKEN', default=None)
+
 # File upload settings
 MAX_UPLOAD_SIZE = 10485760  # 10MB in bytes
 
@@ -194,4 +260,52 @@ MAX_UPLOAD_SIZE = 10485760  # 10MB in bytes
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 
 NVIDIA_API_KEY = os.getenv('NVIDIA_API_KEY')
-QDRANT_HOST = os.getenv('QDRANT_HOST')
\ No newline at end of file
+NVIDIA_BASE_URL = env('NVIDIA_BASE_URL', default='https://integrate.api.nvidia.com/v1')
+QDRANT_HOST = os.getenv('QDRANT_HOST')
+
+# Vector store: 'qdrant', or 'pgvector' to keep embeddings in PostgreSQL and run without Qdrant
+VECTOR_BACKEND = env('VECTOR_BACKEND', default='qdrant')
+PGVECTOR_EF_SEARCH = env.int('PGVECTOR_EF_SEARCH', default=64)  # HNSW search-time candidate list size
+# Keep scanning the HNSW index until a filtered search has enough rows (pgvector >= 0.8): 'relaxed_order',
+# 'strict_order', or '' on older pgvector, where filtered searches can return fewer rows than asked for
+PGVECTOR_ITERATIVE_SCAN = env('PGVECTOR_ITERATIVE_SCAN', default='relaxed_order')
+
+# Qdrant collection settings (applied to an existing collection on startup)
+QDRANT_HNSW_M = env.int('QDRANT_HNSW_M', default=16)
+QDRANT_HNSW_EF_CONSTRUCT = env.int('QDRANT_HNSW_EF_CONSTRUCT', default=128)
+QDRANT_HNSW_EF = env.int('QDRANT_HNSW_EF', default=64)  # search-time beam width
+QDRANT_FULL_SCAN_THRESHOLD = env.int('QDRANT_FULL_SCAN_THRESHOLD', default=10000)  # KB
+QDRANT_INDEXING_THRESHOLD = env.int('QDRANT_INDEXING_THRESHOLD', default=20000)  # KB
+QDRANT_QUANTIZATION = env.bool('QDRANT_QUANTIZATION', default=False)  # scalar int8 quantization
+QDRANT_VECTORS_ON_DISK = env.bool('QDRANT_VECTORS_ON_DISK', default=False)
+
+# Keep chunk text in Qdrant payloads too; by default points hold only filter fields and text is read from PostgreSQL
+CHUNK_CONTENT_IN_PAYLOAD = env.bool('CHUNK_CONTENT_IN_PAYLOAD', default=False)
+
+# Pooled HTTP client settings (per process)
+HTTP_POOL_CONNECTIONS = env.int('HTTP_POOL_CONNECTIONS', default=4)  # hosts kept in the pool
+HTTP_POOL_MAXSIZE = env.int('HTTP_POOL_MAXSIZE', default=16)  # keep-alive connections per host
+
+# Document ingestion settings
+CHUNKER = env('CHUNKER', default='tokens')  # 'tokens' (token-aware, structure-preserving) or 'characters'
+CHUNK_TOKENS = env.int('CHUNK_TOKENS', default=384)  # cl100k tokens; margin below the 512-token limit of NV-Embed-QA
+CHUNK_OVERLAP_TOKENS = env.int('CHUNK_OVERLAP_TOKENS', default=64)
+CHUNK_SIZE = env.int('CHUNK_SIZE', default=1000)  # characters, for CHUNKER=characters
+CHUNK_OVERLAP = env.int('CHUNK_OVERLAP', default=200)  # characters, for CHUNKER=characters
+INGESTION_BATCH_SIZE = env.int('INGESTION_BATCH_SIZE', default=128)  # chunks embedded and stored per batch
+PDF_EXTRACTION_WORKERS = env.int('PDF_EXTRACTION_WORKERS', default=4)  # parallel page-range shards for large PDFs
+PDF_PARALLEL_MIN_PAGES = env.int('PDF_PARALLEL_MIN_PAGES', default=200)  # smaller PDFs are extracted in-task
+# Uploads of this size or more go to the ingest_large queue. Keep it well under MAX_UPLOAD_SIZE (10 MB),
+# or almost nothing is routed there.
+INGESTION_LARGE_FILE_BYTES = env.int('INGESTION_LARGE_FILE_BYTES', default=3 * 1024 * 1024)
+INGESTION_MAX_TASKS_PER_USER = env.int('INGESTION_MAX_TASKS_PER_USER', default=2)  # ingestion tasks of one user running at once
+INGESTION_FAIRNESS_DELAY = env.int('INGESTION_FAIRNESS_DELAY', default=20)  # seconds before a deferred task is retried
+INGESTION_SLOT_TTL = env.int('INGESTION_SLOT_TTL', default=60 * 60 * 6)  # slots of dead workers expire after this
+INGESTION_MAX_RETRIES = env.int('INGESTION_MAX_RETRIES', default=5)  # retries of a failed ingestion, with backoff
+
+# Embedding scheduler settings
+EMBEDDING_BATCH_SIZE = env.int('EMBEDDING_BATCH_SIZE', default=32)  # texts per embedding API request
+EMBEDDING_MAX_CONCURRENCY = env.int('EMBEDDING_MAX_CONCURRENCY', default=4)  # embedding requests in flight
+EMBEDDING_MAX_RETRIES = env.int('EMBEDDING_MAX_RETRIES', default=5)
+EMBEDDING_BACKOFF_BASE = env.float('EMBEDDING_BACKOFF_BASE', default=0.5)  # seconds
+EMBEDDING_BACKOFF_MAX = env.float('EMBEDDING_BACKOFF_MAX', default=30.0)  # seconds
\ No newline at end of file
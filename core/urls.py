@@ -2,13 +2,21 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
-from documents.views import serve_pdf
+from documents.views import serve_pdf, chat_stream, metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/auth/', include('dj_rest_auth.urls')),
     path('api/auth/registration/', include('dj_rest_auth.registration.urls')),
     path('api/pdf/<int:pk>/', serve_pdf, name='serve_pdf'),    
+    path('metrics', metrics_view, name='metrics'),
+]
+
+if settings.ASYNC_CHAT:
+    # Serve the chat endpoint from the async view when running under ASGI
+    urlpatterns.append(path('api/conversations/<int:pk>/chat/', chat_stream, name='conversation-chat-async'))
+
+urlpatterns += [
     path('api/', include('documents.urls')),
 ]
 
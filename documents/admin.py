@@ -1,12 +1,12 @@
 from django.contrib import admin
-from .models import Document, DocumentChunk, Conversation, Message
+from .models import Document, DocumentChunk, Conversation, Message, VectorDeletion, DocumentProcessingRecord
 
 @admin.register(Document)
 class DocumentAdmin(admin.ModelAdmin):
-    list_display = ['title', 'user', 'uploaded_at', 'processed']
-    list_filter = ['processed', 'uploaded_at']
+    list_display = ['title', 'user', 'uploaded_at', 'status', 'chunks_done', 'chunks_total']
+    list_filter = ['status', 'uploaded_at']
     search_fields = ['title', 'user__username']
-    readonly_fields = ['uploaded_at', 'processed']
+    readonly_fields = ['uploaded_at', 'status', 'chunks_done', 'chunks_total', 'error']
 
 @admin.register(DocumentChunk)
 class DocumentChunkAdmin(admin.ModelAdmin):
@@ -27,4 +27,16 @@ class MessageAdmin(admin.ModelAdmin):
     list_display = ['conversation', 'role', 'created_at']
     list_filter = ['role', 'created_at']
     search_fields = ['conversation__document__title', 'content']
-    readonly_fields = ['created_at']
\ No newline at end of file
+    readonly_fields = ['created_at']
+
+@admin.register(DocumentProcessingRecord)
+class DocumentProcessingRecordAdmin(admin.ModelAdmin):
+    list_display = ['document', 'mode', 'status', 'started_at', 'finished_at', 'pages', 'chunks', 'retries']
+    list_filter = ['mode', 'status', 'started_at']
+    search_fields = ['document__title']
+    readonly_fields = ['started_at']
+
+@admin.register(VectorDeletion)
+class VectorDeletionAdmin(admin.ModelAdmin):
+    list_display = ['document_id', 'attempts', 'created_at', 'updated_at']
+    readonly_fields = ['created_at', 'updated_at']
\ No newline at end of file
@@ -0,0 +1,101 @@
+import logging
+import math
+import time
+from array import array
+from typing import List, Optional, Sequence
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .cache_versions import document_version
+
+logger = logging.getLogger(__name__)
+
+
+def _normalize(vector: Sequence[float]) -> List[float]:
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / norm for x in vector]
+
+
+class AnswerCache:
+    """Semantic cache of chat answers per document.
+
+    An answer is served again when a new question's embedding is within the
+    cosine `threshold` of a cached question and retrieval returned the same
+    chunks. Each document keeps at most `max_entries` answers, evicted least
+    recently used first, and all of them go stale when the document's cache
+    version is bumped (e.g. on re-processing).
+    """
+
+    def __init__(self, alias: str, ttl: int, threshold: float, max_entries: int):
+        self.alias = alias
+        self.ttl = ttl
+        self.threshold = threshold
+        self.max_entries = max_entries
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def _key(self, document_id: int) -> str:
+        return f"answers:{document_id}:v{document_version(document_id)}"
+
+    def lookup(self, document_id: int, query_embedding: Sequence[float], chunk_ids: List[str]) -> Optional[str]:
+        """Return a cached answer for a similar question over the same chunks, if any."""
+        key = self._key(document_id)
+        try:
+            entries = self.cache.get(key) or []
+        except Exception as e:
+            logger.warning(f"Answer cache read failed: {e}")
+            return None
+
+        now = time.time()
+        query = _normalize(query_embedding)
+        best_index, best_score = None, self.threshold
+        for i, entry in enumerate(entries):
+            if entry['expires_at'] < now or entry['chunk_ids'] != chunk_ids:
+                continue
+            cached = array('f')
+            cached.frombytes(entry['embedding'])
+            score = sum(a * b for a, b in zip(query, cached))
+            if score >= best_score:
+                best_index, best_score = i, score
+        if best_index is None:
+            return None
+
+        # Move the hit to the front so eviction drops the least recently used entries
+        entry = entries.pop(best_index)
+        entries.insert(0, entry)
+        self._save(key, entries)
+        return entry['answer']
+
+    def store(self, document_id: int, query_embedding: Sequence[float], chunk_ids: List[str], answer: str) -> None:
+        key = self._key(document_id)
+        try:
+            entries = self.cache.get(key) or []
+        except Exception as e:
+            logger.warning(f"Answer cache read failed: {e}")
+            return
+        now = time.time()
+        entries = [entry for entry in entries if entry['expires_at'] >= now]
+        entries.insert(0, {
+            'embedding': array('f', _normalize(query_embedding)).tobytes(),
+            'chunk_ids': chunk_ids,
+            'answer': answer,
+            'expires_at': now + self.ttl,
+        })
+        self._save(key, entries[:self.max_entries])
+
+    def _save(self, key: str, entries: list) -> None:
+        try:
+            self.cache.set(key, entries, timeout=self.ttl)
+        except Exception as e:
+            logger.warning(f"Answer cache write failed: {e}")
+
+
+answer_cache = AnswerCache(
+    alias=settings.ANSWER_CACHE_ALIAS,
+    ttl=settings.ANSWER_CACHE_TTL,
+    threshold=settings.ANSWER_CACHE_THRESHOLD,
+    max_entries=settings.ANSWER_CACHE_MAX_ENTRIES,
+)
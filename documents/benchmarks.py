@@ -0,0 +1,891 @@
+"""Offline benchmark suite for the ingestion and chat hot paths.
+
+Runs against local stand-ins: synthetic PDFs, a deterministic fake embedder,
+a local HTTP embedding server that fails some requests, an in-memory Qdrant
+collection and a fake streaming LLM. The configured
+PostgreSQL database is still used; writes happen inside a transaction that is
+rolled back at the end. Filtered search is also timed against a real Qdrant
+server when one is given.
+"""
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import resource
+import statistics
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.test import override_settings
+from qdrant_client import QdrantClient
+from qdrant_client.http import models
+
+from .chunking import TokenChunker, count_tokens
+from .cache_versions import bump_document_version
+from .clients import chat_key, embeddings_key, get_embeddings, override_client
+from .embedding_scheduler import EmbeddingScheduler
+from .models import Conversation, Document, Message
+from .prompts import build_prompt
+from .qdrant_client import COLLECTION_NAME, qdrant_key
+from .qdrant_schema import (
+    VECTOR_SIZE, ensure_collection, hnsw_config, optimizers_config, quantization_config, search_params, vectors_config
+)
+from .utils import (
+    EMBEDDING_MODEL, ChunkIdentifier, batched, chunk_payload, extract_pdf_pages_parallel, extract_text_from_pdf,
+    hybrid_search_chunks, iter_chunks, iter_pdf_pages, iter_text_chunks, search_lexical_chunks,
+    search_library_chunks, search_similar_chunks, store_document_chunks
+)
+from .views import CHAT_MODEL, CHAT_PARAMS, SYSTEM_PROMPT
+
+WORDS = (
+    "agreement party supplier customer delivery payment invoice term notice period warranty "
+    "liability service level schedule annex obligation breach remedy termination renewal "
+    "confidential information data processing security audit report fee price currency tax "
+    "insurance dispute court law governing amendment assignment subcontractor personnel "
+    "equipment maintenance support incident response time availability credit penalty"
+).split()
+
+# Stand-in vectors must not end up in the shared embedding, answer and version caches
+LOCAL_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'benchmark'}}
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    """Summarize latency samples (seconds) in milliseconds."""
+    ordered = sorted(samples)
+
+    def pick(q):
+        return ordered[min(len(ordered) - 1, math.ceil(q * len(ordered)) - 1)] * 1000
+
+    return {
+        'n': len(ordered),
+        'mean_ms': statistics.fmean(ordered) * 1000,
+        'p50_ms': pick(0.50),
+        'p95_ms': pick(0.95),
+        'p99_ms': pick(0.99),
+        'max_ms': ordered[-1] * 1000,
+    }
+
+
+def peak_rss_mb() -> float:
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(own, children) / 1024  # ru_maxrss is in KB on Linux
+
+
+def part_number(page: int) -> str:
+    return f"PN-{page:05d}"
+
+
+def synthetic_page_lines(page: int, lines: int, seed: int) -> List[str]:
+    rng = random.Random(seed * 100003 + page)
+    text = [f"Section {page + 1}. Part number {part_number(page)} is governed by clause {page + 1}.{rng.randint(1, 9)}."]
+    for _ in range(lines - 1):
+        text.append(' '.join(rng.choice(WORDS) for _ in range(14)).capitalize() + '.')
+    return text
+
+
+def make_synthetic_pdf(path: str, pages: int, lines_per_page: int = 45, seed: int = 0) -> str:
+    """Write a text-only PDF with `pages` pages; page N mentions part number PN-N exactly once."""
+
+    def escape(line):
+        return line.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # page tree, filled in once the page object numbers are known
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    page_ids = []
+    for page in range(pages):
+        body = ' '.join(f"({escape(line)}) Tj T*" for line in synthetic_page_lines(page, lines_per_page, seed))
+        stream = f"BT /F1 9 Tf 11 TL 40 800 Td {body} ET".encode('latin-1')
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        page_ids.append(len(objects) + 1)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % (len(objects))
+        )
+    kids = ' '.join(f"{page_id} 0 R" for page_id in page_ids)
+    objects[1] = f"<< /Type /Pages /Kids [{kids}] /Count {pages} >>".encode()
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, obj in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += b"%d 0 obj\n" % number + obj + b"\nendobj\n"
+    xref = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    output += b''.join(b"%010d 00000 n \n" % offset for offset in offsets)
+    output += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+
+    with open(path, 'wb') as f:
+        f.write(output)
+    return path
+
+
+class FakeEmbeddings:
+    """Deterministic hashed bag-of-words embedder with optional simulated request latency."""
+
+    def __init__(self, size: int = VECTOR_SIZE, latency: float = 0.0):
+        self.size = size
+        self.latency = latency
+        self.requests = 0
+
+    def _vector(self, text: str) -> List[float]:
+        vector = [0.0] * self.size
+        for token in re.findall(r'\w[\w-]*', text.lower()):
+            h = int.from_bytes(hashlib.blake2b(token.encode(), digest_size=8).digest(), 'big')
+            vector[h % self.size] += 1.0 if (h >> 32) & 1 else -1.0
+        norm = math.sqrt(sum(x * x for x in vector))
+        if not norm:
+            vector[0], norm = 1.0, 1.0
+        return [x / norm for x in vector]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.requests += 1
+        time.sleep(self.latency)
+        return [self._vector(text) for text in texts]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.requests += 1
+        await asyncio.sleep(self.latency)
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        self.requests += 1
+        time.sleep(self.latency)
+        return self._vector(text)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        self.requests += 1
+        await asyncio.sleep(self.latency)
+        return self._vector(text)
+
+
+class FakeChatModel:
+    """Streams a fixed answer token by token, like ChatNVIDIA.stream/astream, or returns it whole from ainvoke."""
+
+    def __init__(self, tokens: int = 64, delay: float = 0.0):
+        self.tokens = tokens
+        self.delay = delay
+        self.prompt_tokens = []
+
+    def stream(self, messages):
+        self.prompt_tokens.append(sum(count_tokens(message.content) for message in messages))
+        for i in range(self.tokens):
+            time.sleep(self.delay)
+            yield SimpleNamespace(content=f"token{i} ")
+
+    async def astream(self, messages):
+        self.prompt_tokens.append(sum(count_tokens(message.content) for message in messages))
+        for i in range(self.tokens):
+            await asyncio.sleep(self.delay)
+            yield SimpleNamespace(content=f"token{i} ")
+
+    async def ainvoke(self, messages):
+        self.prompt_tokens.append(sum(count_tokens(message.content) for message in messages))
+        await asyncio.sleep(self.delay * self.tokens)
+        return SimpleNamespace(content=''.join(f"token{i} " for i in range(self.tokens)))
+
+
+def _timed(fn: Callable[[], Any]):
+    started = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - started, result
+
+
+def bench_extraction(pdfs: Dict[int, str], workers: List[int]) -> Dict[str, Any]:
+    results = {'cpu_count': os.cpu_count(), 'documents': []}
+    for pages, path in pdfs.items():
+        elapsed, text = _timed(lambda: extract_text_from_pdf(path))
+        entry = {
+            'pages': pages,
+            'bytes': len(text.encode('utf-8')),
+            'serial_pages_per_s': pages / elapsed,
+            'parallel_pages_per_s': {},
+        }
+        for count in workers:
+            elapsed, _ = _timed(lambda: list(extract_pdf_pages_parallel(path, count)))
+            entry['parallel_pages_per_s'][count] = pages / elapsed
+        results['documents'].append(entry)
+    return results
+
+
+def bench_chunking(pages: List[str], repeat: int = 3) -> Dict[str, Any]:
+    """Throughput and chunk size spread (in tokens) of the character and token chunkers."""
+    chunkers = {
+        'characters': lambda: list(iter_text_chunks(pages)),
+        'tokens': lambda: [chunk.text for chunk in TokenChunker(
+            settings.CHUNK_TOKENS, settings.CHUNK_OVERLAP_TOKENS).split(pages)],
+    }
+    megabytes = sum(len(page.encode('utf-8')) for page in pages) / 1e6
+    results = {'megabytes': megabytes}
+    for name, chunk in chunkers.items():
+        samples, chunks = [], []
+        for _ in range(repeat):
+            elapsed, chunks = _timed(chunk)
+            samples.append(elapsed)
+        tokens = [count_tokens(text) for text in chunks]
+        results[name] = {
+            'chunks': len(chunks),
+            'mb_per_s': megabytes / min(samples),
+            'latency': percentiles(samples),
+            'tokens_mean': statistics.fmean(tokens),
+            'tokens_stdev': statistics.pstdev(tokens),
+            'tokens_max': max(tokens),
+        }
+    return results
+
+
+def bench_embedding(texts: List[str], concurrency: List[int], latency: float) -> Dict[str, Any]:
+    """Throughput of the embedding scheduler against a fake embedder with fixed request latency."""
+    results = {'texts': len(texts), 'request_latency_s': latency, 'texts_per_s': {}}
+    for count in concurrency:
+        fake = FakeEmbeddings(latency=latency)
+        scheduler = EmbeddingScheduler(
+            batch_size=settings.EMBEDDING_BATCH_SIZE,
+            max_concurrency=count,
+            max_retries=0,
+            backoff_base=0,
+            backoff_max=0
+        )
+        elapsed, _ = _timed(lambda: asyncio.run(scheduler.embed(texts, fake.aembed_documents)))
+        results['texts_per_s'][count] = len(texts) / elapsed
+    return results
+
+
+class FakeEmbeddingServer:
+    """Local HTTP stand-in for the NVIDIA embeddings API that fails a share of requests with 429 or 503.
+
+    Rate limits come back as problem+json with a status field, like the hosted
+    API; 503s with a plain-text body, like a proxy in front of it. Use it as a
+    context manager and point an NVIDIAEmbeddings client at `base_url`.
+    """
+
+    def __init__(self, failure_rate: float = 0.2, seed: int = 4):
+        self.failure_rate = failure_rate
+        self.rng = random.Random(seed)
+        self.embedder = FakeEmbeddings()
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.failures = {429: 0, 503: 0}
+        self.server = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_port}/v1"
+
+    def __enter__(self) -> 'FakeEmbeddingServer':
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def send(self, code: int, body: bytes, content_type: str = 'application/json'):
+                self.send_response(code)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                # Model listing, read when the client is created
+                self.send(200, json.dumps({'object': 'list', 'data': [{'id': EMBEDDING_MODEL, 'object': 'model'}]}).encode())
+
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                with fake.lock:
+                    fake.requests += 1
+                    failure = fake.rng.choice((429, 503)) if fake.rng.random() < fake.failure_rate else None
+                    if failure:
+                        fake.failures[failure] += 1
+                if failure == 429:
+                    self.send(429, json.dumps({
+                        'type': 'about:blank', 'title': 'Too Many Requests', 'status': 429,
+                        'detail': 'Rate limit exceeded'
+                    }).encode(), content_type='application/problem+json')
+                elif failure == 503:
+                    self.send(503, b'Service Unavailable', content_type='text/plain')
+                else:
+                    self.send(200, json.dumps({
+                        'object': 'list',
+                        'model': request['model'],
+                        'data': [
+                            {'object': 'embedding', 'index': i, 'embedding': fake.embedder._vector(text)}
+                            for i, text in enumerate(request['input'])
+                        ],
+                        'usage': {'prompt_tokens': 0, 'total_tokens': 0},
+                    }).encode())
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def bench_embedding_retries(texts: List[str], failure_rate: float = 0.2, concurrency: int = 4) -> Dict[str, Any]:
+    """Embed through the real NVIDIA client against a local server that answers some requests with 429 or 503.
+
+    Exercises the scheduler's retry path end to end: status parsing of the
+    client's errors and jittered backoff.
+    """
+    scheduler = EmbeddingScheduler(
+        batch_size=settings.EMBEDDING_BATCH_SIZE,
+        max_concurrency=concurrency,
+        max_retries=settings.EMBEDDING_MAX_RETRIES,
+        backoff_base=0.05,
+        backoff_max=1.0
+    )
+    with FakeEmbeddingServer(failure_rate=failure_rate) as server:
+        client = get_embeddings(EMBEDDING_MODEL, base_url=server.base_url)
+        try:
+            elapsed, vectors = _timed(lambda: asyncio.run(scheduler.embed(texts, client.aembed_documents)))
+            error = None
+        except Exception as e:
+            elapsed, vectors, error = None, [], str(e)
+    return {
+        'texts': len(texts),
+        'failure_rate': failure_rate,
+        'requests': server.requests,
+        'failures': {str(code): count for code, count in server.failures.items()},
+        'retries': scheduler.retries,
+        'seconds': elapsed,
+        'complete': error is None and len(vectors) == len(texts),
+        'error': error,
+    }
+
+
+def bench_store(document, chunks: List[str], embedder: FakeEmbeddings) -> Dict[str, Any]:
+    identifier = ChunkIdentifier(document.id)
+    samples = []
+    chunk_number = 0
+    for batch in batched(chunks, settings.INGESTION_BATCH_SIZE):
+        embeddings = embedder.embed_documents(batch)
+        numbers = range(chunk_number, chunk_number + len(batch))
+        vector_ids = [identifier(chunk) for chunk in batch]
+        elapsed, _ = _timed(lambda: store_document_chunks(document, batch, embeddings, vector_ids, numbers))
+        samples.append(elapsed)
+        chunk_number += len(batch)
+    return {
+        'chunks': len(chunks),
+        'chunks_per_s': len(chunks) / sum(samples),
+        'batch_latency': percentiles(samples),
+    }
+
+
+def add_noise_documents(user, count: int, embedder: FakeEmbeddings, per_document: int = 500, seed: int = 1) -> None:
+    """Store chunks of other documents so the per-document filters have work to do."""
+    rng = random.Random(seed)
+    for start in range(0, count, per_document):
+        document = Document.objects.create(title='benchmark noise', file='benchmarks/noise.pdf', user=user)
+        identifier = ChunkIdentifier(document.id)
+        size = min(per_document, count - start)
+        for numbers in batched(range(size), 256):
+            texts = [' '.join(rng.choice(WORDS) for _ in range(60)) for _ in numbers]
+            store_document_chunks(
+                document,
+                texts,
+                embedder.embed_documents(texts),
+                vector_ids=[identifier(text) for text in texts],
+                chunk_numbers=numbers
+            )
+
+
+def retrieval_queries(pages: int, count: int) -> List[Dict[str, Any]]:
+    step = max(1, pages // count)
+    return [
+        {'query': f"Which clause governs part number {part_number(page)}?", 'expected': part_number(page)}
+        for page in range(0, pages, step)
+    ][:count]
+
+
+def bench_payload_layout(document, queries: List[Dict[str, Any]], embedder: FakeEmbeddings,
+                         top_k: int = 3) -> Dict[str, Any]:
+    """Qdrant payload size and dense search latency with chunk text in the payload or read from PostgreSQL."""
+    rows = list(document.chunks.values_list('vector_id', 'chunk_number', 'content'))
+    results = {'points': len(rows), 'vector_bytes': len(rows) * VECTOR_SIZE * 4}
+    for layout, in_payload in (('postgres', False), ('payload', True)):
+        client = QdrantClient(location=':memory:')
+        ensure_collection(client, COLLECTION_NAME)
+        with override_settings(CHUNK_CONTENT_IN_PAYLOAD=in_payload), override_client(qdrant_key(), client):
+            payload_bytes = 0
+            for batch in batched(rows, 256):
+                points = []
+                for vector_id, chunk_number, content in batch:
+                    payload = chunk_payload(document.id, chunk_number, content, document.user_id)
+                    payload_bytes += len(json.dumps(payload).encode('utf-8'))
+                    points.append(models.PointStruct(id=vector_id, vector=embedder._vector(content), payload=payload))
+                client.upsert(collection_name=COLLECTION_NAME, points=points)
+
+            samples = []
+            for item in queries:
+                embedding = embedder.embed_query(item['query'])
+                elapsed, _ = _timed(lambda: search_similar_chunks(item['query'], document, top_k, query_embedding=embedding))
+                samples.append(elapsed)
+        results[layout] = {'payload_bytes': payload_bytes, 'latency': percentiles(samples)}
+    return results
+
+
+def bench_retrieval(document, queries: List[Dict[str, Any]], embedder: FakeEmbeddings, top_k: int = 3) -> Dict[str, Any]:
+    """Latency and recall@k of dense, lexical and hybrid retrieval over one document."""
+    retrievers = {
+        'dense': lambda q, e: search_similar_chunks(q, document, top_k, query_embedding=e),
+        'lexical': lambda q, e: search_lexical_chunks(q, document, top_k),
+        'hybrid': lambda q, e: hybrid_search_chunks(q, document, top_k, query_embedding=e),
+    }
+    results = {}
+    for name, retrieve in retrievers.items():
+        samples, hits = [], 0
+        for item in queries:
+            embedding = embedder.embed_query(item['query'])
+            elapsed, found = _timed(lambda: retrieve(item['query'], embedding))
+            samples.append(elapsed)
+            hits += any(item['expected'] in chunk['content'] for chunk in found)
+        results[name] = {'latency': percentiles(samples), f'recall@{top_k}': hits / len(queries)}
+    return results
+
+
+def bench_library(sizes: List[int], queries: List[Dict[str, Any]], embedder: FakeEmbeddings,
+                  chunks_per_document: int = 40, looped_queries: int = 5) -> Dict[str, Any]:
+    """Time library-scope retrieval as a user's library grows, against one search per document."""
+    user = get_user_model().objects.create_user(
+        username=f"benchmark-library-{uuid.uuid4().hex[:12]}",
+        email=f"benchmark-library-{uuid.uuid4().hex[:12]}@example.com"
+    )
+    results = {'chunks_per_document': chunks_per_document}
+    stored = 0
+    for size in sorted(sizes):
+        add_noise_documents(user, (size - stored) * chunks_per_document, embedder,
+                            per_document=chunks_per_document, seed=size)
+        stored = size
+        embeddings = [embedder.embed_query(item['query']) for item in queries]
+
+        library = []
+        for item, embedding in zip(queries, embeddings):
+            elapsed, _ = _timed(lambda: search_library_chunks(item['query'], user.id, query_embedding=embedding))
+            library.append(elapsed)
+
+        documents = list(Document.objects.filter(user=user))
+        looped = []
+        for item, embedding in list(zip(queries, embeddings))[:looped_queries]:
+            elapsed, _ = _timed(lambda: [
+                search_similar_chunks(item['query'], document, settings.LIBRARY_CHUNKS_PER_DOCUMENT, embedding)
+                for document in documents
+            ])
+            looped.append(elapsed)
+        results[str(size)] = {'library_search': percentiles(library), 'search_per_document': percentiles(looped)}
+    return results
+
+
+def _wait_until_indexed(client: QdrantClient, collection_name: str, timeout: float = 600.0) -> None:
+    deadline = time.monotonic() + timeout
+    while client.get_collection(collection_name).status != models.CollectionStatus.GREEN:
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Collection {collection_name} was not optimized within {timeout:.0f}s")
+        time.sleep(1.0)
+
+
+def bench_filtered_search(url: str, points: int, documents: int = 100, users: int = 10, queries: int = 200,
+                          top_k: int = 3, seed: int = 3) -> Dict[str, Any]:
+    """Filtered search latency on a Qdrant server, with and without the payload indexes.
+
+    Searches by document_id (chat) and user_id (library scope) in a collection
+    shared by many documents. Uses throwaway collections, deleted afterwards.
+    """
+    client = QdrantClient(url=url)
+
+    def vector(rng):
+        values = [rng.gauss(0.0, 1.0) for _ in range(VECTOR_SIZE)]
+        norm = math.sqrt(sum(x * x for x in values))
+        return [x / norm for x in values]
+
+    results = {'points': points, 'documents': documents, 'users': users}
+    rng = random.Random(seed + 1)
+    query_vectors = [vector(rng) for _ in range(queries)]
+    filters = {
+        'document': lambda i: models.Filter(must=[models.FieldCondition(
+            key='document_id', match=models.MatchValue(value=i % documents)
+        )]),
+        'user': lambda i: models.Filter(must=[models.FieldCondition(
+            key='user_id', match=models.MatchValue(value=i % users)
+        )]),
+    }
+    for variant, indexed in (('without_indexes', False), ('with_indexes', True)):
+        collection_name = f"benchmark_filtered_{uuid.uuid4().hex[:12]}"
+        if indexed:
+            ensure_collection(client, collection_name)
+        else:
+            client.create_collection(
+                collection_name=collection_name,
+                vectors_config=vectors_config(),
+                hnsw_config=hnsw_config(),
+                optimizers_config=optimizers_config(),
+                quantization_config=quantization_config()
+            )
+        try:
+            # Both collections hold the same points
+            rng = random.Random(seed)
+            for numbers in batched(range(points), 256):
+                client.upsert(collection_name=collection_name, wait=True, points=[
+                    models.PointStruct(id=number, vector=vector(rng), payload={
+                        'document_id': number % documents,
+                        'user_id': number % documents % users,
+                        'chunk_number': number // documents,
+                    })
+                    for number in numbers
+                ])
+            _wait_until_indexed(client, collection_name)
+
+            results[variant] = {}
+            for name, query_filter in filters.items():
+                samples = []
+                for i, query_vector in enumerate(query_vectors):
+                    elapsed, _ = _timed(lambda: client.search(
+                        collection_name=collection_name,
+                        query_vector=query_vector,
+                        query_filter=query_filter(i),
+                        limit=top_k,
+                        search_params=search_params()
+                    ))
+                    samples.append(elapsed)
+                results[variant][name] = percentiles(samples)
+        finally:
+            client.delete_collection(collection_name)
+    return results
+
+
+def bench_prompt(chunks: List[str], turns: int = 20, answer_words: int = 300, seed: int = 2) -> Dict[str, Any]:
+    """Prompt tokens of the budgeted prompt builder against sending top-3 chunks and the last 5 messages verbatim."""
+    rng = random.Random(seed)
+    history, legacy, budgeted = [], [], []
+    for turn in range(turns):
+        retrieved = [
+            {'vector_id': str(i), 'content': chunks[i]}
+            for i in rng.sample(range(len(chunks)), min(settings.PROMPT_CANDIDATE_CHUNKS, len(chunks)))
+        ]
+        question = SimpleNamespace(role='user', content=f"What does clause {turn + 1} say about {rng.choice(WORDS)}?")
+        history.append(question)
+
+        recent = history[-5:]
+        legacy.append(
+            count_tokens(SYSTEM_PROMPT)
+            + count_tokens("Context from the document:\n" + '\n\n'.join(chunk['content'] for chunk in retrieved[:3]))
+            + sum(count_tokens(msg.content) for msg in recent)
+        )
+        prompt = build_prompt(SYSTEM_PROMPT, retrieved, history[-settings.PROMPT_HISTORY_MESSAGES:])
+        budgeted.append(sum(count_tokens(message.content) for message in prompt.messages))
+
+        history.append(SimpleNamespace(role='assistant', content=' '.join(rng.choice(WORDS) for _ in range(answer_words))))
+    return {
+        'turns': turns,
+        'legacy_tokens_mean': statistics.fmean(legacy),
+        'legacy_tokens_max': max(legacy),
+        'budgeted_tokens_mean': statistics.fmean(budgeted),
+        'budgeted_tokens_max': max(budgeted),
+        'budget': settings.PROMPT_MAX_TOKENS,
+    }
+
+
+def bench_chat(conversation, user, questions: List[str], chat_model: FakeChatModel) -> Dict[str, Any]:
+    """Drive ConversationViewSet.chat end to end and time the streamed response."""
+    from rest_framework.test import APIRequestFactory, force_authenticate
+    from .views import ConversationViewSet
+
+    view = ConversationViewSet.as_view({'post': 'chat'})
+    factory = APIRequestFactory()
+    first_token, total = [], []
+    for question in questions:
+        request = factory.post(f'/api/conversations/{conversation.id}/chat/', {'message': question}, format='json')
+        force_authenticate(request, user=user)
+        started = time.perf_counter()
+        response = view(request, pk=conversation.id)
+        first = None
+        for _ in response.streaming_content:
+            if first is None:
+                first = time.perf_counter() - started
+        total.append(time.perf_counter() - started)
+        first_token.append(first if first is not None else total[-1])
+    return {
+        'time_to_first_token': percentiles(first_token),
+        'total': percentiles(total),
+        'prompt_tokens_mean': statistics.fmean(chat_model.prompt_tokens) if chat_model.prompt_tokens else 0,
+    }
+
+
+def bench_chat_stream(chunks: List[str], questions: List[str], embedder: FakeEmbeddings,
+                      concurrency: List[int]) -> Dict[str, Any]:
+    """Drive the async chat_stream view with concurrent requests and time the streamed responses.
+
+    Retrieval runs on pool threads with their own database connections, which
+    cannot see uncommitted rows, so this scenario commits its own user and
+    document (pgvector backend, nothing outside PostgreSQL) and deletes them
+    afterwards. Run it outside the suite's transaction. A document has a single
+    conversation, so the clients share it, like one user asking from several tabs.
+    """
+    from asgiref.sync import async_to_sync
+    from django.test import RequestFactory
+    from rest_framework_simplejwt.tokens import AccessToken
+    from .views import chat_stream
+
+    factory = RequestFactory()
+    user = get_user_model().objects.create_user(
+        username=f"benchmark-stream-{uuid.uuid4().hex[:12]}",
+        email=f"benchmark-stream-{uuid.uuid4().hex[:12]}@example.com"
+    )
+    try:
+        document = Document.objects.create(title='benchmark', file='benchmarks/synthetic.pdf', user=user)
+        bench_store(document, chunks, embedder)
+        conversation = Conversation.objects.create(document=document, user=user)
+        authorization = f"Bearer {AccessToken.for_user(user)}"
+
+        async def ask(conversation, question):
+            request = factory.post(
+                f'/api/conversations/{conversation.id}/chat/',
+                data=json.dumps({'message': question}),
+                content_type='application/json',
+                HTTP_AUTHORIZATION=authorization
+            )
+            started = time.perf_counter()
+            response = await chat_stream(request, pk=conversation.id)
+            first = None
+            async for _ in response.streaming_content:
+                if first is None:
+                    first = time.perf_counter() - started
+            total = time.perf_counter() - started
+            return first if first is not None else total, total
+
+        async def client(asked):
+            # One simulated client asking its questions in turn
+            return [await ask(conversation, question) for question in asked]
+
+        async def run(clients):
+            # The questions are split between the clients, so answers are not served from the answer cache
+            per_client = max(1, len(questions) // clients)
+            return await asyncio.gather(*(
+                client([questions[(i * per_client + j) % len(questions)] for j in range(per_client)])
+                for i in range(clients)
+            ))
+
+        results = {}
+        for clients in concurrency:
+            bump_document_version(document.id)
+            started = time.perf_counter()
+            timings = [timing for answers in async_to_sync(run)(clients) for timing in answers]
+            elapsed = time.perf_counter() - started
+            results[str(clients)] = {
+                'requests': len(timings),
+                'requests_per_s': len(timings) / elapsed,
+                'time_to_first_token': percentiles([first for first, _ in timings]),
+                'total': percentiles([total for _, total in timings]),
+            }
+        return results
+    finally:
+        user.delete()
+
+
+def bench_batch_chat(conversation, user, questions: List[str], embedder: FakeEmbeddings) -> Dict[str, Any]:
+    """Answer the same questions with one chat request each and with one batch-chat request."""
+    from django.core.cache import caches
+    from rest_framework.test import APIRequestFactory, force_authenticate
+    from .views import ConversationViewSet
+
+    factory = APIRequestFactory()
+    results = {'questions': len(questions)}
+    for mode in ('sequential', 'batch'):
+        caches['default'].clear()  # no answer or retrieval cache hits from earlier runs
+        requests = embedder.requests
+        started = time.perf_counter()
+        if mode == 'sequential':
+            view = ConversationViewSet.as_view({'post': 'chat'})
+            for question in questions:
+                request = factory.post(f'/api/conversations/{conversation.id}/chat/', {'message': question}, format='json')
+                force_authenticate(request, user=user)
+                for _ in view(request, pk=conversation.id).streaming_content:
+                    pass
+        else:
+            view = ConversationViewSet.as_view({'post': 'batch_chat'})
+            request = factory.post(f'/api/conversations/{conversation.id}/batch-chat/', {'questions': questions}, format='json')
+            force_authenticate(request, user=user)
+            for _ in view(request, pk=conversation.id).streaming_content:
+                pass
+        results[mode] = {'seconds': time.perf_counter() - started, 'embedding_requests': embedder.requests - requests}
+    results['speedup'] = results['sequential']['seconds'] / results['batch']['seconds']
+    return results
+
+
+def bench_messages(conversation, count: int, page_size: int = 20, samples: int = 5) -> Dict[str, Any]:
+    """Page through a long conversation with the cursor paginator and with page numbers.
+
+    Cursor pages are walked front to back by following `next`; page-number
+    pages are sampled at increasing depth, where OFFSET and COUNT(*) grow.
+    """
+    from rest_framework.pagination import PageNumberPagination
+    from rest_framework.request import Request
+    from rest_framework.test import APIRequestFactory
+    from .serializers import MessageSerializer
+    from .views import MessagePagination
+
+    Message.objects.bulk_create(
+        [Message(conversation=conversation, role='user' if i % 2 else 'assistant', content=' '.join(WORDS[:30]))
+         for i in range(count)],
+        batch_size=1000
+    )
+    messages = Message.objects.filter(conversation=conversation)
+    factory = APIRequestFactory()
+
+    def page(paginator, url, queryset=messages, fields=None):
+        # The default host, testserver, is not in ALLOWED_HOSTS; pagination links are built from it
+        request = Request(factory.get(url, SERVER_NAME='localhost'))
+        started = time.perf_counter()
+        items = paginator.paginate_queryset(queryset, request)
+        data = paginator.get_paginated_response(MessageSerializer(items, many=True, fields=fields).data).data
+        return time.perf_counter() - started, data
+
+    cursor_times = []
+    url = f'/api/conversations/{conversation.id}/messages/?page_size={page_size}'
+    while url:
+        elapsed, data = page(MessagePagination(), url)
+        cursor_times.append(elapsed)
+        url = data['next']
+    tenth = max(1, len(cursor_times) // 10)
+
+    class PagePagination(PageNumberPagination):
+        page_size_query_param = 'page_size'
+
+    last_page = math.ceil(count / page_size)
+    offset_times = {}
+    for number in sorted({max(1, round(last_page * i / (samples - 1))) for i in range(samples)}):
+        url = f'/api/conversations/{conversation.id}/messages/?page_size={page_size}&page={number}'
+        offset_times[number] = percentiles([page(PagePagination(), url, messages.order_by('-created_at'))[0]
+                                            for _ in range(3)])
+
+    projected = [page(MessagePagination(), f'/api/conversations/{conversation.id}/messages/?page_size={page_size}',
+                      messages.only('id', 'created_at', 'role', 'content'), ['role', 'content'])[0]
+                 for _ in range(10)]
+    return {
+        'messages': count,
+        'page_size': page_size,
+        'cursor': {
+            'pages': len(cursor_times),
+            'first_pages': percentiles(cursor_times[:tenth]),
+            'last_pages': percentiles(cursor_times[-tenth:]),
+        },
+        'page_number': {str(number): stats for number, stats in offset_times.items()},
+        'cursor_projected_first_page': percentiles(projected),
+    }
+
+
+def run_suite(workdir: str, pages: List[int], queries: int = 50, workers: List[int] = (1, 2, 4),
+              concurrency: List[int] = (1, 2, 4, 8), embed_latency: float = 0.05, noise_points: int = 5000,
+              llm_tokens: int = 64, llm_delay: float = 0.0, chat_turns: int = 20, batch_questions: int = 30,
+              messages: int = 5000, library_sizes: List[int] = (10, 50, 200),
+              backends: List[str] = ('qdrant', 'pgvector'), qdrant_url: str = None, filtered_points: int = 50000,
+              stream_concurrency: List[int] = (1, 4, 16), log=print) -> Dict[str, Any]:
+    """Run every benchmark and return the JSON-serializable report."""
+    report = {'results': {}}
+    results = report['results']
+
+    pdfs = {}
+    for count in pages:
+        pdfs[count] = make_synthetic_pdf(os.path.join(workdir, f"synthetic-{count}.pdf"), count)
+
+    log("extraction")
+    results['extraction'] = bench_extraction(pdfs, list(workers))
+
+    largest = max(pdfs)
+    document_pages = list(iter_pdf_pages(pdfs[largest]))
+    log("chunking")
+    results['chunking'] = bench_chunking(document_pages)
+    chunks = [chunk.text for chunk in iter_chunks(document_pages)]
+
+    log("prompt")
+    results['prompt'] = bench_prompt(chunks)
+
+    log("embedding")
+    results['embedding'] = bench_embedding(chunks, list(concurrency), embed_latency)
+    log("embedding retries")
+    with override_settings(METRICS_ENABLED=False):
+        results['embedding_retries'] = bench_embedding_retries(chunks)
+
+    if qdrant_url:
+        log("filtered search")
+        results['filtered_search'] = bench_filtered_search(qdrant_url, filtered_points)
+
+    embedder = FakeEmbeddings()
+    chat_model = FakeChatModel(tokens=llm_tokens, delay=llm_delay)
+    query_items = retrieval_queries(largest, queries)
+    for name in ('store', 'retrieval', 'library'):
+        results[name] = {}
+
+    log("concurrent chat stream")
+    with override_client(embeddings_key(EMBEDDING_MODEL), embedder), \
+            override_client(chat_key(CHAT_MODEL, **CHAT_PARAMS), chat_model), \
+            override_settings(CACHES=LOCAL_CACHES, METRICS_ENABLED=False, VECTOR_BACKEND='pgvector'):
+        questions = [item['query'] for item in query_items[:chat_turns]]
+        results['chat_stream'] = bench_chat_stream(chunks, questions, embedder, list(stream_concurrency))
+        results['chat_stream'].update({'backend': 'pgvector', 'llm_tokens': llm_tokens, 'llm_delay_s': llm_delay})
+
+    with override_client(embeddings_key(EMBEDDING_MODEL), embedder), \
+            override_client(chat_key(CHAT_MODEL, **CHAT_PARAMS), chat_model), \
+            override_settings(CACHES=LOCAL_CACHES, METRICS_ENABLED=False), \
+            transaction.atomic():
+        user = get_user_model().objects.create_user(
+            username=f"benchmark-{uuid.uuid4().hex[:12]}",
+            email=f"benchmark-{uuid.uuid4().hex[:12]}@example.com"
+        )
+
+        for backend in backends:
+            # Each backend gets its own documents and collection, so noise is not shared
+            qdrant = QdrantClient(location=':memory:')
+            ensure_collection(qdrant, COLLECTION_NAME)
+            with override_client(qdrant_key(), qdrant), override_settings(VECTOR_BACKEND=backend):
+                document = Document.objects.create(title='benchmark', file='benchmarks/synthetic.pdf', user=user)
+
+                log(f"store ({backend})")
+                results['store'][backend] = bench_store(document, chunks, embedder)
+                add_noise_documents(user, noise_points, embedder)
+
+                log(f"retrieval ({backend})")
+                results['retrieval'][backend] = bench_retrieval(document, query_items, embedder)
+                results['retrieval'][backend]['noise_points'] = noise_points
+
+                log(f"library retrieval ({backend})")
+                results['library'][backend] = bench_library(list(library_sizes), query_items[:20], embedder)
+
+                if backend == 'qdrant':
+                    log("payload layout")
+                    results['payload_layout'] = bench_payload_layout(document, query_items, embedder)
+
+                if backend == backends[0]:
+                    log(f"chat ({backend})")
+                    conversation = Conversation.objects.create(document=document, user=user)
+                    questions = [item['query'] for item in query_items[:chat_turns]]
+                    results['chat'] = bench_chat(conversation, user, questions, chat_model)
+                    results['chat'].update({'backend': backend, 'llm_tokens': llm_tokens, 'llm_delay_s': llm_delay})
+
+                    log(f"batch chat ({backend})")
+                    batch = [item['query'] for item in query_items[:batch_questions]]
+                    results['batch_chat'] = bench_batch_chat(conversation, user, batch, embedder)
+                    results['batch_chat']['backend'] = backend
+
+                    log("message pagination")
+                    results['messages'] = bench_messages(conversation, messages)
+
+        transaction.set_rollback(True)
+
+    report['peak_rss_mb'] = peak_rss_mb()
+    return report
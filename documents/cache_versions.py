@@ -0,0 +1,50 @@
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+
+def _key(document_id: int) -> str:
+    return f"doc:version:{document_id}"
+
+
+def _initial_version() -> int:
+    # Versions start from the clock, so a key that expired or was deleted comes back
+    # higher than any version it had before, never reviving older cache entries
+    return int(time.time() * 1000)
+
+
+def document_version(document_id: int) -> int:
+    """Return the cache generation of a document; cache keys embedding it go stale when it is bumped."""
+    try:
+        version = cache.get(_key(document_id))
+        if version is None:
+            cache.add(_key(document_id), _initial_version(), timeout=settings.CACHE_VERSION_TTL)
+            version = cache.get(_key(document_id), 1)
+        return version
+    except Exception as e:
+        logger.warning(f"Could not read cache version of document {document_id}: {e}")
+        return 0
+
+
+def bump_document_version(document_id: int) -> None:
+    """Invalidate every cache entry derived from a document's chunks."""
+    try:
+        try:
+            cache.incr(_key(document_id))
+        except ValueError:
+            if not cache.add(_key(document_id), _initial_version(), timeout=settings.CACHE_VERSION_TTL):
+                cache.incr(_key(document_id))
+    except Exception as e:
+        logger.warning(f"Could not bump cache version of document {document_id}: {e}")
+
+
+def forget_document_version(document_id: int) -> None:
+    """Drop the version key of a deleted document."""
+    try:
+        cache.delete(_key(document_id))
+    except Exception as e:
+        logger.warning(f"Could not delete cache version of document {document_id}: {e}")
@@ -0,0 +1,144 @@
+import re
+from bisect import bisect_left
+from functools import lru_cache
+from itertools import accumulate
+from typing import Iterable, Iterator, List, NamedTuple, Optional
+
+import tiktoken
+
+# Split point preference, weakest to strongest
+LINE, PARAGRAPH, PAGE, HEADING = 1, 2, 3, 4
+
+_LINE_START = re.compile(rb'\n(?=[^\n])')
+_PARAGRAPH_START = re.compile(rb'\n[ \t]*\n\s*(?=\S)')
+# Short lines that look like headings: Markdown, keyword ("Section 4"), numbered ("2.1 Scope") or all caps
+_HEADING = re.compile(
+    rb'^(?=[^\n]{1,80}$)[ \t]*(?:#{1,6}[ \t]+\S'
+    rb'|(?i:chapter|section|part|article|appendix|annex|schedule)[ \t]+[\w.]+'
+    rb'|\d{1,2}(?:\.\d{1,2})*\.?[ \t]+[A-Z]'
+    rb'|[A-Z][A-Z0-9 ,&/\'-]{3,60}[ \t]*$)',
+    re.MULTILINE
+)
+
+
+@lru_cache(maxsize=None)
+def get_encoding(name: str = 'cl100k_base') -> tiktoken.Encoding:
+    """Return a shared tiktoken encoding; loading one is expensive."""
+    return tiktoken.get_encoding(name)
+
+
+def count_tokens(text: str) -> int:
+    """Count tokens with the cl100k encoding (an approximation for non-OpenAI models)."""
+    return len(get_encoding().encode(text, disallowed_special=()))
+
+
+class Chunk(NamedTuple):
+    text: str
+    page_start: Optional[int]  # 1-based page numbers, None when unknown
+    page_end: Optional[int]
+    tokens: int
+
+
+class TokenChunker:
+    """Split page texts into chunks of at most `chunk_tokens` tokens.
+
+    Each page is tokenized once; chunks are cut at token positions, preferring
+    heading, page, paragraph and line boundaries (in that order) once a chunk
+    holds at least `min_tokens`. Consecutive chunks overlap by about
+    `overlap_tokens`, except where a new section starts at a heading.
+    """
+
+    def __init__(self, chunk_tokens: int, overlap_tokens: int, min_tokens: int = None,
+                 encoding: tiktoken.Encoding = None):
+        if not 0 <= overlap_tokens < chunk_tokens:
+            raise ValueError("overlap_tokens must be smaller than chunk_tokens")
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = overlap_tokens
+        self.min_tokens = chunk_tokens // 2 if min_tokens is None else min_tokens
+        self.encoding = encoding or get_encoding()
+        self._token_length = lru_cache(maxsize=None)(
+            lambda token: len(self.encoding.decode_single_token_bytes(token))
+        )
+
+    def split(self, pages: Iterable[str], first_page: int = 1) -> Iterator[Chunk]:
+        """Lazily chunk a stream of page texts."""
+        data = bytearray()  # UTF-8 text of the pending tokens
+        offsets: List[int] = []  # byte offset of each pending token in `data`
+        token_pages: List[int] = []
+        boundaries = {}  # token index -> split preference
+        position = 0  # first token of the next chunk
+
+        for page_number, page in enumerate(pages, start=first_page):
+            if position:
+                # Drop tokens already emitted so the buffer stays bounded
+                base = offsets[position]
+                del data[:base]
+                offsets = [offset - base for offset in offsets[position:]]
+                del token_pages[:position]
+                boundaries = {index - position: kind for index, kind in boundaries.items() if index >= position}
+                position = 0
+
+            self._append_page(page, page_number, data, offsets, token_pages, boundaries)
+
+            # Cut only while the window is complete; the rest waits for the next page
+            while len(offsets) - position > self.chunk_tokens:
+                chunk, position = self._cut(data, offsets, token_pages, boundaries, position)
+                if chunk.text:
+                    yield chunk
+
+        while position < len(offsets):
+            chunk, position = self._cut(data, offsets, token_pages, boundaries, position)
+            if chunk.text:
+                yield chunk
+
+    def _append_page(self, page, page_number, data, offsets, token_pages, boundaries):
+        if not page.strip():
+            return
+        if not page.endswith('\n'):
+            page += '\n'  # keep the last line of a page apart from the first line of the next
+        encoded = page.encode('utf-8')
+        tokens = self.encoding.encode(page, disallowed_special=())
+        if not tokens:
+            return
+        base = len(data)
+        start = len(offsets)
+        data += encoded
+        offsets.extend(accumulate(map(self._token_length, tokens[:-1]), initial=base))
+        token_pages.extend([page_number] * len(tokens))
+
+        def mark(byte_position, kind):
+            index = bisect_left(offsets, base + byte_position, lo=start)
+            if 0 < index < len(offsets):
+                boundaries[index] = max(boundaries.get(index, 0), kind)
+
+        if start:
+            mark(0, PAGE)
+        for match in _LINE_START.finditer(encoded):
+            mark(match.end(), LINE)
+        for match in _PARAGRAPH_START.finditer(encoded):
+            mark(match.end(), PARAGRAPH)
+        for match in _HEADING.finditer(encoded):
+            mark(match.start(), HEADING)
+
+    def _cut(self, data, offsets, token_pages, boundaries, position):
+        limit = min(position + self.chunk_tokens, len(offsets))
+        end, kind = limit, 0
+        if limit < len(offsets):
+            for index in range(position + max(1, self.min_tokens), limit + 1):
+                preference = boundaries.get(index, 0)
+                if preference and preference >= kind:
+                    end, kind = index, preference
+
+        stop = offsets[end] if end < len(offsets) else len(data)
+        text = bytes(data[offsets[position]:stop]).decode('utf-8', errors='ignore')
+        chunk = Chunk(text.strip(), token_pages[position], token_pages[end - 1], end - position)
+
+        if end >= len(offsets) or kind == HEADING or not self.overlap_tokens:
+            return chunk, end
+        # Start the overlap at the nearest line boundary if there is one close by
+        overlap_start = max(position + 1, end - self.overlap_tokens)
+        for index in range(overlap_start, end):
+            if boundaries.get(index):
+                overlap_start = index
+                break
+        return chunk, overlap_start
@@ -0,0 +1,103 @@
+import os
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Hashable
+
+import requests
+from django.conf import settings
+from langchain_nvidia_ai_endpoints import ChatNVIDIA, NVIDIAEmbeddings
+from requests.adapters import HTTPAdapter
+
+# Long-lived clients of this process, keyed by (kind, model, base_url, ...)
+_clients: Dict[Hashable, Any] = {}
+_lock = threading.Lock()
+_pid = os.getpid()
+
+
+def _reset_after_fork() -> None:
+    """Drop clients inherited from the parent; their sockets must not be shared."""
+    global _lock, _pid
+    _clients.clear()
+    _lock = threading.Lock()
+    _pid = os.getpid()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_client(key: Hashable, factory: Callable[[], Any]) -> Any:
+    """Return the client registered under `key`, creating it with `factory` on first use."""
+    if _pid != os.getpid():
+        _reset_after_fork()
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                client = _clients[key] = factory()
+    return client
+
+
+@contextmanager
+def override_client(key: Hashable, client: Any):
+    """Temporarily register `client` under `key`, e.g. to swap in a local stand-in."""
+    previous = _clients.get(key)
+    _clients[key] = client
+    try:
+        yield client
+    finally:
+        if previous is None:
+            _clients.pop(key, None)
+        else:
+            _clients[key] = previous
+
+
+def pooled_session() -> requests.Session:
+    """Return a keep-alive requests session with the configured connection pool size."""
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=settings.HTTP_POOL_CONNECTIONS,
+        pool_maxsize=settings.HTTP_POOL_MAXSIZE
+    )
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def _share_session(client):
+    # langchain_nvidia_ai_endpoints opens a new requests.Session for every call by default
+    inner = getattr(client, '_client', None)
+    if inner is not None and hasattr(inner, 'get_session_fn'):
+        session = pooled_session()
+        inner.get_session_fn = lambda: session
+    return client
+
+
+def embeddings_key(model: str, base_url: str = None) -> Hashable:
+    return ('embeddings', model, base_url or settings.NVIDIA_BASE_URL)
+
+
+def chat_key(model: str, base_url: str = None, **params) -> Hashable:
+    return ('chat', model, base_url or settings.NVIDIA_BASE_URL, tuple(sorted(params.items())))
+
+
+def get_embeddings(model: str, base_url: str = None) -> NVIDIAEmbeddings:
+    """Return the pooled NVIDIA embeddings client for `model`."""
+    base_url = base_url or settings.NVIDIA_BASE_URL
+    # Chunks are sized with tiktoken, not the model's tokenizer; cut the rare overlong one instead of failing
+    return get_client(
+        embeddings_key(model, base_url),
+        lambda: _share_session(NVIDIAEmbeddings(
+            model=model, base_url=base_url, api_key=settings.NVIDIA_API_KEY, truncate='END'
+        ))
+    )
+
+
+def get_chat_model(model: str, base_url: str = None, **params) -> ChatNVIDIA:
+    """Return the pooled NVIDIA chat client for `model` and generation parameters."""
+    base_url = base_url or settings.NVIDIA_BASE_URL
+    return get_client(
+        chat_key(model, base_url, **params),
+        lambda: _share_session(ChatNVIDIA(model=model, base_url=base_url, api_key=settings.NVIDIA_API_KEY, **params))
+    )
@@ -0,0 +1,182 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from typing import Dict, List, Optional, Sequence
+
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+HITS_KEY = 'emb:stats:hits'
+MISSES_KEY = 'emb:stats:misses'
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace so trivially different copies of a text share a cache entry."""
+    return ' '.join(text.split())
+
+
+def make_key(model: str, input_type: str, text: str) -> str:
+    digest = hashlib.sha256(normalize_text(text).encode('utf-8')).hexdigest()
+    return f"emb:{model}:{input_type}:{digest}"
+
+
+def _pack(vector: Sequence[float]) -> bytes:
+    return array('f', vector).tobytes()
+
+
+def _unpack(data: bytes) -> List[float]:
+    vector = array('f')
+    vector.frombytes(data)
+    return vector.tolist()
+
+
+class DiskTier:
+    """Local SQLite-backed cache tier with LRU and TTL eviction."""
+
+    def __init__(self, path: str, max_entries: int, ttl: int):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+
+    def _connection(self) -> sqlite3.Connection:
+        # Connections must not be shared across a fork (celery prefork, gunicorn).
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS embeddings '
+                '(key TEXT PRIMARY KEY, vector BLOB NOT NULL, accessed_at REAL NOT NULL)'
+            )
+            self._conn.execute('CREATE INDEX IF NOT EXISTS embeddings_accessed_at ON embeddings (accessed_at)')
+            self._pid = os.getpid()
+        return self._conn
+
+    def get_many(self, keys: List[str]) -> Dict[str, bytes]:
+        if not keys:
+            return {}
+        now = time.time()
+        placeholders = ','.join('?' * len(keys))
+        with self._lock:
+            conn = self._connection()
+            rows = conn.execute(
+                f'SELECT key, vector FROM embeddings WHERE key IN ({placeholders}) AND accessed_at > ?',
+                [*keys, now - self.ttl]
+            ).fetchall()
+            if rows:
+                conn.executemany(
+                    'UPDATE embeddings SET accessed_at = ? WHERE key = ?',
+                    [(now, key) for key, _ in rows]
+                )
+                conn.commit()
+        return dict(rows)
+
+    def set_many(self, items: Dict[str, bytes]) -> None:
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.executemany(
+                'INSERT OR REPLACE INTO embeddings (key, vector, accessed_at) VALUES (?, ?, ?)',
+                [(key, value, now) for key, value in items.items()]
+            )
+            conn.execute('DELETE FROM embeddings WHERE accessed_at <= ?', (now - self.ttl,))
+            conn.execute(
+                'DELETE FROM embeddings WHERE key IN ('
+                'SELECT key FROM embeddings ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)',
+                (self.max_entries,)
+            )
+            conn.commit()
+
+
+class EmbeddingCache:
+    """Content-addressed embedding cache keyed by (model, input type, normalized text hash).
+
+    Entries live in the Redis cache backend and, optionally, in a local disk
+    tier that is checked first. Cache failures are logged and treated as misses.
+    """
+
+    def __init__(self, alias: str, ttl: int, disk_path: Optional[str] = None, disk_max_entries: int = 100000):
+        self.alias = alias
+        self.ttl = ttl
+        self.disk = DiskTier(disk_path, disk_max_entries, ttl) if disk_path else None
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def get_many(self, model: str, input_type: str, texts: List[str]) -> List[Optional[List[float]]]:
+        """Return cached embeddings in the order of `texts`, with None for misses."""
+        keys = [make_key(model, input_type, text) for text in texts]
+        found = {}
+        if self.disk:
+            try:
+                found.update(self.disk.get_many(keys))
+            except Exception as e:
+                logger.warning(f"Embedding disk cache read failed: {e}")
+        remote_keys = [key for key in keys if key not in found]
+        if remote_keys:
+            try:
+                remote = self.cache.get_many(remote_keys)
+            except Exception as e:
+                logger.warning(f"Embedding cache read failed: {e}")
+                remote = {}
+            found.update(remote)
+            if self.disk and remote:
+                try:
+                    self.disk.set_many(remote)
+                except Exception as e:
+                    logger.warning(f"Embedding disk cache write failed: {e}")
+
+        hits = sum(1 for key in keys if key in found)
+        self._count(HITS_KEY, hits)
+        self._count(MISSES_KEY, len(keys) - hits)
+        return [_unpack(found[key]) if key in found else None for key in keys]
+
+    def set_many(self, model: str, input_type: str, texts: List[str], vectors: List[List[float]]) -> None:
+        items = {make_key(model, input_type, text): _pack(vector) for text, vector in zip(texts, vectors)}
+        if self.disk:
+            try:
+                self.disk.set_many(items)
+            except Exception as e:
+                logger.warning(f"Embedding disk cache write failed: {e}")
+        try:
+            self.cache.set_many(items, timeout=self.ttl)
+        except Exception as e:
+            logger.warning(f"Embedding cache write failed: {e}")
+
+    def stats(self) -> Dict[str, int]:
+        try:
+            values = self.cache.get_many([HITS_KEY, MISSES_KEY])
+        except Exception:
+            values = {}
+        return {'hits': values.get(HITS_KEY, 0), 'misses': values.get(MISSES_KEY, 0)}
+
+    def _count(self, key: str, amount: int) -> None:
+        if not amount:
+            return
+        try:
+            try:
+                self.cache.incr(key, amount)
+            except ValueError:
+                # Counters never expire, so volatile-lru eviction leaves them alone.
+                if not self.cache.add(key, amount, timeout=None):
+                    self.cache.incr(key, amount)
+        except Exception as e:
+            logger.warning(f"Embedding cache counter update failed: {e}")
+
+
+embedding_cache = EmbeddingCache(
+    alias=settings.EMBEDDING_CACHE_ALIAS,
+    ttl=settings.EMBEDDING_CACHE_TTL,
+    disk_path=settings.EMBEDDING_CACHE_DISK_PATH,
+    disk_max_entries=settings.EMBEDDING_CACHE_DISK_MAX_ENTRIES,
+)
@@ -0,0 +1,97 @@
+import asyncio
+import logging
+import random
+import re
+from typing import Awaitable, Callable, List, Optional
+
+import requests
+from django.conf import settings
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+# langchain_nvidia_ai_endpoints raises plain exceptions formatted as "[429] Too Many Requests ..."
+_STATUS_PATTERN = re.compile(r'^\[(\d{3})\]')
+
+
+def _status_code(exc: BaseException) -> Optional[int]:
+    for attr in ('status_code', 'status'):
+        value = getattr(exc, attr, None)
+        if isinstance(value, int):
+            return value
+    response = getattr(exc, 'response', None)
+    value = getattr(response, 'status_code', None)
+    if isinstance(value, int):
+        return value
+    match = _STATUS_PATTERN.match(str(exc))
+    return int(match.group(1)) if match else None
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """Return True for rate limiting, server errors and transport failures."""
+    if isinstance(exc, (asyncio.TimeoutError, ConnectionError, requests.ConnectionError, requests.Timeout)):
+        return True
+    return _status_code(exc) in RETRYABLE_STATUS_CODES
+
+
+class EmbeddingScheduler:
+    """Embed texts in fixed-size batches with bounded concurrency and retries.
+
+    At most `max_concurrency` batches are in flight at once. Failed batches are
+    retried with full-jitter exponential backoff when the error is retryable,
+    and results are returned in the order of the input texts.
+    """
+
+    def __init__(self, batch_size: int, max_concurrency: int, max_retries: int,
+                 backoff_base: float, backoff_max: float):
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retries = 0
+
+    @classmethod
+    def from_settings(cls, **overrides) -> 'EmbeddingScheduler':
+        options = {
+            'batch_size': settings.EMBEDDING_BATCH_SIZE,
+            'max_concurrency': settings.EMBEDDING_MAX_CONCURRENCY,
+            'max_retries': settings.EMBEDDING_MAX_RETRIES,
+            'backoff_base': settings.EMBEDDING_BACKOFF_BASE,
+            'backoff_max': settings.EMBEDDING_BACKOFF_MAX,
+        }
+        return cls(**{**options, **overrides})
+
+    async def embed(self, texts: List[str],
+                    embed_batch: Callable[[List[str]], Awaitable[List[List[float]]]]) -> List[List[float]]:
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+
+        async def run(batch: List[str]) -> List[List[float]]:
+            async with semaphore:
+                return await self._embed_with_retry(batch, embed_batch)
+
+        results = await asyncio.gather(*(run(batch) for batch in batches))
+        return [vector for batch_vectors in results for vector in batch_vectors]
+
+    async def _embed_with_retry(self, batch, embed_batch):
+        attempt = 0
+        while True:
+            try:
+                vectors = await embed_batch(batch)
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+                logger.warning(f"Embedding batch failed ({e}), retrying in {delay:.2f}s")
+                attempt += 1
+                self.retries += 1
+                metrics.inc('embedding_retries_total')
+                await asyncio.sleep(delay)
+                continue
+            if len(vectors) != len(batch):
+                raise ValueError(f"Expected {len(batch)} embeddings, got {len(vectors)}")
+            return vectors
@@ -0,0 +1,107 @@
+import json
+import os
+import platform
+import subprocess
+import tempfile
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from documents.benchmarks import run_suite
+
+
+def _int_list(value):
+    return [int(item) for item in value.split(',') if item]
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark extraction, chunking, embedding scheduling, vector storage, retrieval and chat "
+        "against synthetic PDFs and local stand-ins for the NVIDIA APIs and Qdrant."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', type=_int_list, default=[10, 100, 500],
+                            help="Comma-separated page counts of the synthetic PDFs.")
+        parser.add_argument('--queries', type=int, default=50, help="Retrieval queries per retriever.")
+        parser.add_argument('--workers', type=_int_list, default=[1, 2, 4],
+                            help="Process counts for parallel extraction.")
+        parser.add_argument('--concurrency', type=_int_list, default=[1, 2, 4, 8],
+                            help="Embedding scheduler concurrency levels.")
+        parser.add_argument('--embed-latency', type=float, default=0.05,
+                            help="Simulated latency of one embedding request, in seconds.")
+        parser.add_argument('--noise-points', type=int, default=5000,
+                            help="Chunks of other documents stored before searching.")
+        parser.add_argument('--llm-tokens', type=int, default=64, help="Tokens streamed per fake LLM answer.")
+        parser.add_argument('--llm-delay', type=float, default=0.0,
+                            help="Simulated delay per streamed LLM token, in seconds.")
+        parser.add_argument('--chat-turns', type=int, default=20, help="Chat requests to time.")
+        parser.add_argument('--stream-concurrency', type=_int_list, default=[1, 4, 16],
+                            help="Concurrent clients of the async chat_stream view; each level shares --chat-turns questions.")
+        parser.add_argument('--batch-questions', type=int, default=30,
+                            help="Questions answered one by one and in one batch-chat request.")
+        parser.add_argument('--library-sizes', type=_int_list, default=[10, 50, 200],
+                            help="Comma-separated library sizes (documents) for the library retrieval benchmark.")
+        parser.add_argument('--messages', type=int, default=5000,
+                            help="Messages in the conversation used for the pagination benchmark.")
+        parser.add_argument('--backends', type=lambda value: [item for item in value.split(',') if item],
+                            default=['qdrant', 'pgvector'], help="Comma-separated vector store backends to compare.")
+        parser.add_argument('--qdrant-url',
+                            help="Qdrant server (e.g. http://qdrant:6333) for the filtered-search benchmark, "
+                                 "which compares latency with and without payload indexes; skipped when unset.")
+        parser.add_argument('--filtered-points', type=int, default=50000,
+                            help="Points stored for the filtered-search benchmark.")
+        parser.add_argument('--output', help="Write the JSON report to this file instead of stdout.")
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory(prefix='benchmark-') as workdir:
+            report = run_suite(
+                workdir,
+                pages=options['pages'],
+                queries=options['queries'],
+                workers=options['workers'],
+                concurrency=options['concurrency'],
+                embed_latency=options['embed_latency'],
+                noise_points=options['noise_points'],
+                llm_tokens=options['llm_tokens'],
+                llm_delay=options['llm_delay'],
+                chat_turns=options['chat_turns'],
+                batch_questions=options['batch_questions'],
+                messages=options['messages'],
+                library_sizes=options['library_sizes'],
+                backends=options['backends'],
+                qdrant_url=options['qdrant_url'],
+                filtered_points=options['filtered_points'],
+                stream_concurrency=options['stream_concurrency'],
+                log=lambda name: self.stderr.write(f"Running {name} benchmark..."),
+            )
+
+        report['meta'] = {
+            'commit': self._git_commit(),
+            'finished_at': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'cpu_count': os.cpu_count(),
+            'options': {key: options[key] for key in (
+                'pages', 'queries', 'workers', 'concurrency', 'embed_latency',
+                'noise_points', 'llm_tokens', 'llm_delay', 'chat_turns', 'batch_questions', 'messages',
+                'library_sizes', 'backends', 'qdrant_url', 'filtered_points',
+                'stream_concurrency'
+            )},
+        }
+        output = json.dumps(report, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+            self.stderr.write(self.style.SUCCESS(f"Report written to {options['output']}"))
+        else:
+            self.stdout.write(output)
+
+    @staticmethod
+    def _git_commit():
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'],
+                capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
@@ -0,0 +1,219 @@
+import logging
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+
+from django.conf import settings
+from django.utils import timezone
+from django_redis import get_redis_connection
+
+from .embedding_cache import embedding_cache
+
+logger = logging.getLogger(__name__)
+
+# Metrics are aggregated in Redis so web and Celery processes report into the same series
+KEY_PREFIX = 'metrics:'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+RATE_BUCKETS = (1, 5, 10, 20, 50, 100, 200, 500)
+TOKEN_BUCKETS = (128, 256, 512, 1024, 1536, 2048, 3072, 4096, 8192)
+
+# name -> (type, help, buckets)
+REGISTRY: Dict[str, Tuple[str, str, Optional[tuple]]] = {
+    'ingestion_stage_seconds': ('histogram', 'Wall time per ingestion stage.', LATENCY_BUCKETS),
+    'ingestion_documents_total': ('counter', 'Documents ingested, by mode and status.', None),
+    'ingestion_pages_total': ('counter', 'PDF pages extracted.', None),
+    'ingestion_chunks_total': ('counter', 'Chunks produced.', None),
+    'ingestion_bytes_total': ('counter', 'Bytes of extracted text.', None),
+    'ingestion_tokens_total': ('counter', 'Tokens in produced chunks.', None),
+    'embedding_retries_total': ('counter', 'Embedding requests retried after a retryable error.', None),
+    'chat_requests_total': ('counter', 'Chat requests, by answer cache result.', None),
+    'chat_retrieval_seconds': ('histogram', 'Query embedding and retrieval latency per chat turn.', LATENCY_BUCKETS),
+    'chat_time_to_first_token_seconds': ('histogram', 'Time from request to first streamed token.', LATENCY_BUCKETS),
+    'chat_tokens_per_second': ('histogram', 'LLM generation throughput.', RATE_BUCKETS),
+    'chat_completion_tokens_total': ('counter', 'Tokens generated by the LLM.', None),
+    'retrieval_cache_requests_total': ('counter', 'Retrieval cache lookups, by result (hit, coalesced, miss).', None),
+    'retrieval_cache_seconds_saved_total': ('counter', 'Retrieval time saved by retrieval cache hits.', None),
+    'chat_prompt_tokens': ('histogram', 'Estimated prompt tokens sent to the LLM per chat turn.', TOKEN_BUCKETS),
+    'chat_prompt_tokens_total': ('counter', 'Estimated prompt tokens sent to the LLM.', None),
+    'celery_queue_wait_seconds': ('histogram', 'Time tasks spent queued before a worker started them, by queue.', LATENCY_BUCKETS),
+    'celery_task_run_seconds': ('histogram', 'Task run time, by queue, task and final state.', LATENCY_BUCKETS),
+    'ingestion_deferred_total': ('counter', 'Ingestion tasks put back because their user had no free slot, by queue.', None),
+}
+
+
+def _labels(labels: Dict[str, str]) -> str:
+    return ','.join(f'{key}="{value}"' for key, value in sorted(labels.items()))
+
+
+def inc(name: str, amount: float = 1, **labels) -> None:
+    """Increment a counter."""
+    if not amount or not settings.METRICS_ENABLED:
+        return
+    try:
+        get_redis_connection('default').hincrbyfloat(KEY_PREFIX + name, _labels(labels), amount)
+    except Exception as e:
+        logger.warning(f"Could not record metric {name}: {e}")
+
+
+def observe(name: str, value: float, **labels) -> None:
+    """Record an observation in a histogram."""
+    if not settings.METRICS_ENABLED:
+        return
+    _, _, buckets = REGISTRY[name]
+    label_string = _labels(labels)
+    try:
+        pipe = get_redis_connection('default').pipeline(transaction=False)
+        key = KEY_PREFIX + name
+        for bound in buckets:
+            if value <= bound:
+                pipe.hincrbyfloat(key, f'bucket:{bound}:{label_string}', 1)
+        pipe.hincrbyfloat(key, f'bucket:+Inf:{label_string}', 1)
+        pipe.hincrbyfloat(key, f'sum::{label_string}', value)
+        pipe.hincrbyfloat(key, f'count::{label_string}', 1)
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"Could not record metric {name}: {e}")
+
+
+def _format(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def render() -> str:
+    """Render all metrics in the Prometheus text exposition format."""
+    connection = get_redis_connection('default')
+    lines = []
+    for name, (kind, help_text, buckets) in REGISTRY.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        values = {field.decode(): float(value) for field, value in connection.hgetall(KEY_PREFIX + name).items()}
+        if kind == 'counter':
+            for label_string, value in sorted(values.items()):
+                lines.append(f'{name}{{{label_string}}} {_format(value)}' if label_string else f'{name} {_format(value)}')
+            continue
+        series = defaultdict(dict)
+        for field, value in values.items():
+            part, bound, label_string = field.split(':', 2)
+            series[label_string][(part, bound)] = value
+        for label_string, points in sorted(series.items()):
+            prefix = f'{label_string},' if label_string else ''
+            for bound in (*buckets, '+Inf'):
+                count = points.get(('bucket', str(bound)), 0)
+                lines.append(f'{name}_bucket{{{prefix}le="{bound}"}} {_format(count)}')
+            suffix = f'{{{label_string}}}' if label_string else ''
+            lines.append(f'{name}_sum{suffix} {_format(points.get(("sum", ""), 0))}')
+            lines.append(f'{name}_count{suffix} {_format(points.get(("count", ""), 0))}')
+
+    stats = embedding_cache.stats()
+    lines.append('# HELP embedding_cache_requests_total Embedding cache lookups, by result.')
+    lines.append('# TYPE embedding_cache_requests_total counter')
+    lines.append(f'embedding_cache_requests_total{{result="hit"}} {stats["hits"]}')
+    lines.append(f'embedding_cache_requests_total{{result="miss"}} {stats["misses"]}')
+    return '\n'.join(lines) + '\n'
+
+
+def record_chat(retrieval_seconds: float, time_to_first_token: Optional[float], completion_tokens: int = 0,
+                generation_seconds: float = 0.0, cached: bool = False, prompt_tokens: int = 0) -> None:
+    """Record the metrics of one chat turn."""
+    inc('chat_requests_total', answer_cache='hit' if cached else 'miss')
+    observe('chat_retrieval_seconds', retrieval_seconds)
+    if time_to_first_token is not None:
+        observe('chat_time_to_first_token_seconds', time_to_first_token)
+    if prompt_tokens:
+        observe('chat_prompt_tokens', prompt_tokens)
+        inc('chat_prompt_tokens_total', prompt_tokens)
+    if completion_tokens and generation_seconds > 0:
+        inc('chat_completion_tokens_total', completion_tokens)
+        observe('chat_tokens_per_second', completion_tokens / generation_seconds)
+
+
+_recorder: ContextVar[Optional['IngestionRecorder']] = ContextVar('ingestion_recorder', default=None)
+
+
+@contextmanager
+def stage(name: str):
+    """Time an ingestion stage, in the global metrics and the active document record."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _add_stage(name, time.perf_counter() - started)
+
+
+def _add_stage(name: str, elapsed: float) -> None:
+    observe('ingestion_stage_seconds', elapsed, stage=name)
+    recorder = _recorder.get()
+    if recorder is not None:
+        recorder.stage_seconds[name] += elapsed
+
+
+class IngestionRecorder:
+    """Collect per-stage timings and counts for one document and store them as a processing record."""
+
+    def __init__(self, document, mode: str):
+        self.document = document
+        self.mode = mode
+        self.stage_seconds = defaultdict(float)
+        self.pages = 0
+        self.chunks = 0
+        self.bytes = 0
+        self.tokens = 0
+        self.retries = 0
+
+    def count_pages(self, pages):
+        """Wrap a page iterator, counting pages and text bytes and timing extraction."""
+        iterator = iter(pages)
+        while True:
+            with stage('extract'):
+                page = next(iterator, None)
+            if page is None:
+                return
+            self.pages += 1
+            self.bytes += len(page.encode('utf-8'))
+            yield page
+
+    def next_batch(self, batches):
+        """Pull the next chunk batch, timing chunking separately from the extraction it triggers."""
+        started, extracted = time.perf_counter(), self.stage_seconds['extract']
+        batch = next(batches, None)
+        _add_stage('chunk', time.perf_counter() - started - (self.stage_seconds['extract'] - extracted))
+        return batch
+
+    def add_chunks(self, chunks, tokens: int) -> None:
+        self.chunks += len(chunks)
+        self.tokens += tokens
+
+    @contextmanager
+    def record(self):
+        """Activate the recorder for the enclosed ingestion and save its DocumentProcessingRecord."""
+        from .models import DocumentProcessingRecord  # runtime import to avoid circular import
+
+        record = DocumentProcessingRecord.objects.create(document=self.document, mode=self.mode)
+        token = _recorder.set(self)
+        status = 'failed'
+        try:
+            yield self
+            status = 'succeeded'
+        except Exception as e:
+            record.error = str(e)
+            raise
+        finally:
+            _recorder.reset(token)
+            record.status = status
+            record.finished_at = timezone.now()
+            record.pages = self.pages
+            record.chunks = self.chunks
+            record.bytes = self.bytes
+            record.tokens = self.tokens
+            record.retries = self.retries
+            record.stage_seconds = dict(self.stage_seconds)
+            record.save()
+
+            inc('ingestion_documents_total', mode=self.mode, status=status)
+            inc('ingestion_pages_total', self.pages)
+            inc('ingestion_chunks_total', self.chunks)
+            inc('ingestion_bytes_total', self.bytes)
+            inc('ingestion_tokens_total', self.tokens)
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.1 on 2026-10-18 12:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0008_documentchunk_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='documentchunk',
+            constraint=models.UniqueConstraint(fields=('document', 'vector_id'), name='unique_chunk_vector_id'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.1.1 on 2026-10-18 13:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0009_documentchunk_unique_chunk_vector_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentProcessingRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mode', models.CharField(max_length=20)),
+                ('status', models.CharField(choices=[('running', 'Running'), ('succeeded', 'Succeeded'), ('failed', 'Failed')], default='running', max_length=10)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('pages', models.PositiveIntegerField(default=0)),
+                ('chunks', models.PositiveIntegerField(default=0)),
+                ('bytes', models.PositiveBigIntegerField(default=0)),
+                ('tokens', models.PositiveBigIntegerField(default=0)),
+                ('retries', models.PositiveIntegerField(default=0)),
+                ('stage_seconds', models.JSONField(blank=True, default=dict)),
+                ('error', models.TextField(blank=True)),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='processing_records', to='documents.document')),
+            ],
+            options={
+                'ordering': ['-started_at'],
+            },
+        ),
+    ]
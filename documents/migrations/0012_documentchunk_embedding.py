@@ -0,0 +1,26 @@
+# Generated by Django 5.1.1 on 2026-10-18 14:40
+
+import pgvector.django.indexes
+import pgvector.django.vector
+from django.db import migrations
+from pgvector.django import VectorExtension
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0011_documentchunk_page_start_page_end'),
+    ]
+
+    operations = [
+        VectorExtension(),
+        migrations.AddField(
+            model_name='documentchunk',
+            name='embedding',
+            field=pgvector.django.vector.VectorField(blank=True, dimensions=1024, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='documentchunk',
+            index=pgvector.django.indexes.HnswIndex(ef_construction=64, fields=['embedding'], m=16, name='chunk_embedding_hnsw', opclasses=['vector_cosine_ops']),
+        ),
+    ]
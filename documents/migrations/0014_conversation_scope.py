@@ -0,0 +1,28 @@
+# Generated by Django 5.1.1 on 2026-10-18 16:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0013_message_conversation_created'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='scope',
+            field=models.CharField(choices=[('document', 'Document'), ('library', 'Library')], default='document', max_length=10),
+        ),
+        migrations.AlterField(
+            model_name='conversation',
+            name='document',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='conversation', to='documents.document'),
+        ),
+        migrations.AddConstraint(
+            model_name='conversation',
+            constraint=models.CheckConstraint(condition=models.Q(models.Q(('document__isnull', False), ('scope', 'document')), models.Q(('document__isnull', True), ('scope', 'library')), _connector='OR'), name='conversation_scope_document'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.1.1 on 2026-10-18 17:20
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def processed_to_status(apps, schema_editor):
+    Document = apps.get_model('documents', 'Document')
+    DocumentChunk = apps.get_model('documents', 'DocumentChunk')
+    chunk_count = Coalesce(Subquery(
+        DocumentChunk.objects.filter(document=OuterRef('pk')).values('document').annotate(count=Count('id')).values('count')
+    ), 0)
+    Document.objects.filter(processed=True).update(status='ready', chunks_total=chunk_count, chunks_done=chunk_count)
+
+
+def status_to_processed(apps, schema_editor):
+    Document = apps.get_model('documents', 'Document')
+    Document.objects.filter(status='ready').update(processed=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0014_conversation_scope'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('extracting', 'Extracting'), ('chunking', 'Chunking'), ('embedding', 'Embedding'), ('ready', 'Ready'), ('failed', 'Failed')], db_index=True, default='pending', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='chunks_total',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='chunks_done',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='error',
+            field=models.TextField(blank=True),
+        ),
+        migrations.RunPython(processed_to_status, status_to_processed),
+        migrations.RemoveField(
+            model_name='document',
+            name='processed',
+        ),
+    ]
@@ -1,52 +1,137 @@
-from django.db import models
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
+from django.db import models, transaction
 from django.contrib.auth import get_user_model
 from django.core.validators import FileExtensionValidator
-from django.db.models.signals import pre_delete
+from django.db.models.signals import post_delete
 from django.dispatch import receiver
-from .qdrant_client import qdrant_client, COLLECTION_NAME
+from pgvector.django import HnswIndex, VectorField
+
+from .cache_versions import forget_document_version
 
 User = get_user_model()
 
 class Document(models.Model):
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('extracting', 'Extracting'),
+        ('chunking', 'Chunking'),
+        ('embedding', 'Embedding'),
+        ('ready', 'Ready'),
+        ('failed', 'Failed'),
+    ]
+
     title = models.CharField(max_length=255)
     file = models.FileField(
         upload_to='documents/',
         validators=[FileExtensionValidator(allowed_extensions=['pdf'])]
     )
     uploaded_at = models.DateTimeField(auto_now_add=True)
-    processed = models.BooleanField(default=False)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending', db_index=True)
+    chunks_total = models.PositiveIntegerField(null=True, blank=True)  # known once chunking is done
+    chunks_done = models.PositiveIntegerField(default=0)  # chunks embedded and stored so far
+    error = models.TextField(blank=True)  # last ingestion error
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='documents')
     file_size = models.PositiveIntegerField(null=True, blank=True) 
+    digest = models.CharField(max_length=64, blank=True, db_index=True)  # SHA-256 of the uploaded file
 
     def __str__(self):
         return self.title
+
+    @property
+    def processed(self) -> bool:
+        return self.status == 'ready'
+
+    def set_status(self, status: str, **fields) -> None:
+        """Save the ingestion status (and progress fields) without touching the rest of the row."""
+        self.status = status
+        for name, value in fields.items():
+            setattr(self, name, value)
+        self.save(update_fields=['status', *fields])
     
+class DocumentChunkQuerySet(models.QuerySet):
+    def delete(self):
+        """Delete the chunks and queue a single bulk delete of their vectors."""
+        vector_ids = [vector_id for vector_id in self.values_list('vector_id', flat=True) if vector_id]
+        result = super().delete()
+        if vector_ids:
+            transaction.on_commit(lambda: _queue_vector_deletion(point_ids=vector_ids))
+        return result
+
+
 class DocumentChunk(models.Model):
     document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name='chunks')
     content = models.TextField()
     chunk_number = models.IntegerField()
     vector_id = models.CharField(max_length=255, null=True, blank=True)  # Store reference to vector in external vector DB
+    page_start = models.PositiveIntegerField(null=True, blank=True)  # first and last PDF page the chunk spans
+    page_end = models.PositiveIntegerField(null=True, blank=True)
+    embedding = VectorField(dimensions=1024, null=True, blank=True)  # only with VECTOR_BACKEND=pgvector
     created_at = models.DateTimeField(auto_now_add=True)
+    search_vector = models.GeneratedField(  # full-text index of content for lexical retrieval
+        expression=SearchVector('content', config='english'),
+        output_field=SearchVectorField(),
+        db_persist=True
+    )
+
+    # Cascade deletes from Document go through the plain base manager and stay a single
+    # SQL DELETE; their vectors are removed by the Document post_delete receiver.
+    objects = DocumentChunkQuerySet.as_manager()
 
     class Meta:
         ordering = ['chunk_number']
         indexes = [
             models.Index(fields=['document', 'chunk_number']),
+            GinIndex(fields=['search_vector'], name='chunk_search_vector_gin'),
+            HnswIndex(
+                fields=['embedding'],
+                name='chunk_embedding_hnsw',
+                m=16,
+                ef_construction=64,
+                opclasses=['vector_cosine_ops']
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['document', 'vector_id'], name='unique_chunk_vector_id'),
         ]
 
     def __str__(self):
         return f"{self.document.title} - Chunk {self.chunk_number}"
 
+    def delete(self, *args, **kwargs):
+        vector_id = self.vector_id
+        result = super().delete(*args, **kwargs)
+        if vector_id:
+            transaction.on_commit(lambda: _queue_vector_deletion(point_ids=[vector_id]))
+        return result
+
 class Conversation(models.Model):
-    document = models.OneToOneField(Document, on_delete=models.CASCADE, related_name='conversation')
+    SCOPE_CHOICES = [
+        ('document', 'Document'),
+        ('library', 'Library'),
+    ]
+
+    document = models.OneToOneField(
+        Document, on_delete=models.CASCADE, related_name='conversation', null=True, blank=True
+    )  # None for library conversations, which search all of the user's documents
+    scope = models.CharField(max_length=10, choices=SCOPE_CHOICES, default='document')
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='conversations')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-updated_at']
+        constraints = [
+            models.CheckConstraint(
+                condition=models.Q(scope='document', document__isnull=False)
+                | models.Q(scope='library', document__isnull=True),
+                name='conversation_scope_document'
+            ),
+        ]
 
     def __str__(self):
+        if self.scope == 'library':
+            return "Conversation with the library"
         return f"Conversation with {self.document.title}"
 
 class Message(models.Model):
@@ -63,19 +148,74 @@ class Message(models.Model):
 
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            # Keyset pagination and recent-history reads of one conversation
+            models.Index(fields=['conversation', 'created_at'], name='message_conversation_created'),
+        ]
 
     def __str__(self):
         return f"{self.role}: {self.content[:50]}..."
 
 
-@receiver(pre_delete, sender=DocumentChunk)
-def delete_vector_from_qdrant(sender, instance, **kwargs):
-    """Delete the corresponding vector from Qdrant when a DocumentChunk is deleted."""
-    if instance.vector_id:
-        try:
-            qdrant_client.delete(
-                collection_name=COLLECTION_NAME,
-                points_selector=[instance.vector_id]
-            )
-        except Exception as e:
-            print(f"Error deleting vector from Qdrant: {e}")
\ No newline at end of file
+class DocumentProcessingRecord(models.Model):
+    """Timings and counts of one ingestion run of a document."""
+    STATUS_CHOICES = [
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    ]
+
+    document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name='processing_records')
+    mode = models.CharField(max_length=20)  # full, sharded, incremental or clone
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='running')
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    pages = models.PositiveIntegerField(default=0)
+    chunks = models.PositiveIntegerField(default=0)
+    bytes = models.PositiveBigIntegerField(default=0)
+    tokens = models.PositiveBigIntegerField(default=0)
+    retries = models.PositiveIntegerField(default=0)
+    stage_seconds = models.JSONField(default=dict, blank=True)  # stage name -> wall time
+    error = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ['-started_at']
+
+    def __str__(self):
+        return f"{self.document.title} - {self.mode} ({self.status})"
+
+
+class VectorDeletion(models.Model):
+    """Outbox entry for a vector delete that failed and must be retried."""
+    document_id = models.BigIntegerField(null=True, blank=True)  # delete every vector of this document
+    point_ids = models.JSONField(default=list, blank=True)  # or only these points
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['created_at']
+
+    def __str__(self):
+        target = f"document {self.document_id}" if self.document_id else f"{len(self.point_ids)} points"
+        return f"Vector deletion for {target}"
+
+
+def _queue_vector_deletion(**kwargs):
+    from .tasks import queue_vector_deletion  # runtime import to avoid circular import
+    queue_vector_deletion(**kwargs)
+
+
+@receiver(post_delete, sender=Document)
+def delete_document_vectors_from_qdrant(sender, instance, **kwargs):
+    """Delete all vectors of a Document from Qdrant with one filter-based request."""
+    document_id = instance.id
+    transaction.on_commit(lambda: _queue_vector_deletion(document_id=document_id))
+
+
+@receiver(post_delete, sender=Document)
+def invalidate_document_caches(sender, instance, **kwargs):
+    """Make cached retrievals and answers of a deleted Document unreachable and drop its version key."""
+    document_id = instance.id
+    transaction.on_commit(lambda: forget_document_version(document_id))
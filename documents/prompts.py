@@ -0,0 +1,110 @@
+import re
+from typing import Any, Dict, List, NamedTuple, Sequence
+
+from django.conf import settings
+from langchain.schema import AIMessage, BaseMessage, HumanMessage, SystemMessage
+
+from .chunking import count_tokens, get_encoding
+
+MESSAGE_OVERHEAD = 4  # role and separator tokens the chat template adds per message
+CONTEXT_HEADER = "Context from the document:\n"
+TRUNCATION_MARK = ' …'
+
+_WORD = re.compile(r'\w+')
+
+
+class Prompt(NamedTuple):
+    messages: List[BaseMessage]
+    tokens: int  # estimated prompt tokens, cl100k approximation
+    chunks: List[Dict[str, Any]]  # retrieved chunks included in the prompt, in rank order
+    history: int  # earlier conversation messages included
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """Cut `text` to at most `max_tokens` tokens, marking the cut."""
+    encoding = get_encoding()
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max(0, max_tokens - 1)]).rstrip() + TRUNCATION_MARK
+
+
+def _shingles(text: str, size: int = 5) -> set:
+    words = _WORD.findall(text.lower())
+    return {hash(tuple(words[i:i + size])) for i in range(max(1, len(words) - size + 1))}
+
+
+def select_chunks(chunks: Sequence[Dict[str, Any]], budget: int, overlap_threshold: float) -> List[Dict[str, Any]]:
+    """Pick ranked chunks that fit `budget` tokens, skipping ones mostly contained in a chunk already picked.
+
+    Returned chunks carry a `tokens` count; the last one may be truncated to fill the budget.
+    """
+    selected, seen, used = [], [], 0
+    for chunk in chunks:
+        shingles = _shingles(chunk['content'])
+        if any(len(shingles & other) >= overlap_threshold * len(shingles) for other in seen):
+            continue
+        tokens = count_tokens(chunk['content']) + 1  # joined with a blank line
+        if used + tokens > budget:
+            remaining = budget - used
+            if remaining >= settings.PROMPT_MIN_CHUNK_TOKENS:
+                content = truncate_tokens(chunk['content'], remaining - 1)
+                selected.append({**chunk, 'content': content, 'tokens': remaining})
+                used = budget
+            break
+        selected.append({**chunk, 'tokens': tokens})
+        seen.append(shingles)
+        used += tokens
+    return selected
+
+
+def _history_message(msg, content: str) -> BaseMessage:
+    return HumanMessage(content=content) if msg.role == 'user' else AIMessage(content=content)
+
+
+def build_prompt(system_prompt: str, chunks: Sequence[Dict[str, Any]], history: Sequence,
+                 max_tokens: int = None, history_tokens: int = None) -> Prompt:
+    """Assemble the chat prompt within a token budget.
+
+    `history` is in chronological order and ends with the current question,
+    which is always included. Earlier messages are added newest first until
+    `history_tokens` is spent; the most recent one is truncated if needed and
+    older ones are dropped. Retrieved chunks (in rank order, deduplicated) fill
+    what is left of `max_tokens`.
+    """
+    max_tokens = settings.PROMPT_MAX_TOKENS if max_tokens is None else max_tokens
+    history_tokens = settings.PROMPT_HISTORY_TOKENS if history_tokens is None else history_tokens
+
+    used = count_tokens(system_prompt) + MESSAGE_OVERHEAD
+    *earlier, question = history
+    question_content = truncate_tokens(question.content, max_tokens // 4)
+    used += count_tokens(question_content) + MESSAGE_OVERHEAD
+
+    kept = []
+    history_used = 0
+    for msg in reversed(earlier):
+        if msg.role not in ('user', 'assistant'):
+            continue
+        tokens = count_tokens(msg.content) + MESSAGE_OVERHEAD
+        if history_used + tokens > history_tokens:
+            remaining = history_tokens - history_used - MESSAGE_OVERHEAD
+            if not kept and remaining >= settings.PROMPT_MIN_CHUNK_TOKENS:
+                content = truncate_tokens(msg.content, remaining)
+                kept.append(_history_message(msg, content))
+                history_used += count_tokens(content) + MESSAGE_OVERHEAD
+            break
+        kept.append(_history_message(msg, msg.content))
+        history_used += tokens
+    used += history_used
+
+    context_budget = max_tokens - used - count_tokens(CONTEXT_HEADER) - MESSAGE_OVERHEAD
+    selected = select_chunks(chunks, max(0, context_budget), settings.PROMPT_DEDUP_OVERLAP)
+
+    messages = [SystemMessage(content=system_prompt)]
+    if selected:
+        context = '\n\n'.join(chunk['content'] for chunk in selected)
+        messages.append(SystemMessage(content=CONTEXT_HEADER + context))
+        used += count_tokens(CONTEXT_HEADER) + MESSAGE_OVERHEAD + sum(chunk['tokens'] for chunk in selected)
+    messages.extend(reversed(kept))
+    messages.append(HumanMessage(content=question_content))
+    return Prompt(messages, used, selected, len(kept))
@@ -1,21 +1,31 @@
+import httpx
 from qdrant_client import QdrantClient
-from qdrant_client.http import models
 from django.conf import settings
 
-# Initialize Qdrant client
-qdrant_client = QdrantClient(url=settings.QDRANT_HOST)
+from .clients import get_client
+from .qdrant_schema import ensure_collection
 
 # Collection name for document vectors
 COLLECTION_NAME = "document_chunks"
 
-# Create collection if it doesn't exist
-try:
-    qdrant_client.get_collection(COLLECTION_NAME)
-except Exception:
-    qdrant_client.create_collection(
-        collection_name=COLLECTION_NAME,
-        vectors_config=models.VectorParams(
-            size=1024,  # NVIDIA NV-Embed-QA embedding size
-            distance=models.Distance.COSINE
+
+def _create_qdrant_client() -> QdrantClient:
+    client = QdrantClient(
+        url=settings.QDRANT_HOST,
+        limits=httpx.Limits(
+            max_connections=settings.HTTP_POOL_MAXSIZE,
+            max_keepalive_connections=settings.HTTP_POOL_MAXSIZE
         )
-    )
\ No newline at end of file
+    )
+    # Create the collection, or bring an existing one in line with the schema
+    ensure_collection(client, COLLECTION_NAME)
+    return client
+
+
+def qdrant_key():
+    return ('qdrant', settings.QDRANT_HOST)
+
+
+def get_qdrant_client() -> QdrantClient:
+    """Return this process's pooled Qdrant client."""
+    return get_client(qdrant_key(), _create_qdrant_client)
\ No newline at end of file
@@ -0,0 +1,112 @@
+import logging
+from typing import Dict, Optional
+
+from django.conf import settings
+from qdrant_client import QdrantClient
+from qdrant_client.http import models
+
+logger = logging.getLogger(__name__)
+
+VECTOR_SIZE = 1024  # NVIDIA NV-Embed-QA embedding size
+
+# Payload fields used in search filters; without an index every filtered search scans the segment
+PAYLOAD_INDEXES: Dict[str, models.PayloadSchemaType] = {
+    'document_id': models.PayloadSchemaType.INTEGER,
+    'user_id': models.PayloadSchemaType.INTEGER,  # library-scope searches
+    'chunk_number': models.PayloadSchemaType.INTEGER,
+}
+
+
+def vectors_config() -> models.VectorParams:
+    return models.VectorParams(
+        size=VECTOR_SIZE,
+        distance=models.Distance.COSINE,
+        on_disk=settings.QDRANT_VECTORS_ON_DISK
+    )
+
+
+def hnsw_config() -> models.HnswConfigDiff:
+    return models.HnswConfigDiff(
+        m=settings.QDRANT_HNSW_M,
+        ef_construct=settings.QDRANT_HNSW_EF_CONSTRUCT,
+        full_scan_threshold=settings.QDRANT_FULL_SCAN_THRESHOLD
+    )
+
+
+def optimizers_config() -> models.OptimizersConfigDiff:
+    return models.OptimizersConfigDiff(indexing_threshold=settings.QDRANT_INDEXING_THRESHOLD)
+
+
+def quantization_config() -> Optional[models.ScalarQuantization]:
+    if not settings.QDRANT_QUANTIZATION:
+        return None
+    return models.ScalarQuantization(
+        scalar=models.ScalarQuantizationConfig(
+            type=models.ScalarType.INT8,
+            quantile=0.99,
+            always_ram=True
+        )
+    )
+
+
+def search_params() -> models.SearchParams:
+    """Search parameters matching the collection spec."""
+    return models.SearchParams(
+        hnsw_ef=settings.QDRANT_HNSW_EF,
+        quantization=models.QuantizationSearchParams(rescore=True) if settings.QDRANT_QUANTIZATION else None
+    )
+
+
+def ensure_collection(client: QdrantClient, collection_name: str) -> None:
+    """Create the collection from the spec above, or reconcile an existing one to it."""
+    try:
+        info = client.get_collection(collection_name)
+    except Exception:
+        client.create_collection(
+            collection_name=collection_name,
+            vectors_config=vectors_config(),
+            hnsw_config=hnsw_config(),
+            optimizers_config=optimizers_config(),
+            quantization_config=quantization_config()
+        )
+        _ensure_payload_indexes(client, collection_name, existing={})
+        return
+
+    config = info.config
+    if config.params.vectors.size != VECTOR_SIZE:
+        logger.error(
+            f"Collection {collection_name} has vector size {config.params.vectors.size}, "
+            f"expected {VECTOR_SIZE}; it must be recreated"
+        )
+
+    update = {}
+    if bool(config.params.vectors.on_disk) != settings.QDRANT_VECTORS_ON_DISK:
+        update['vectors_config'] = {'': models.VectorParamsDiff(on_disk=settings.QDRANT_VECTORS_ON_DISK)}
+
+    wanted_hnsw = hnsw_config()
+    if any(getattr(config.hnsw_config, field) != getattr(wanted_hnsw, field)
+           for field in ('m', 'ef_construct', 'full_scan_threshold')):
+        update['hnsw_config'] = wanted_hnsw
+
+    if config.optimizer_config.indexing_threshold != settings.QDRANT_INDEXING_THRESHOLD:
+        update['optimizers_config'] = optimizers_config()
+
+    wanted_quantization = quantization_config()
+    if (config.quantization_config is None) != (wanted_quantization is None):
+        update['quantization_config'] = wanted_quantization or models.Disabled.DISABLED
+
+    if update:
+        logger.info(f"Updating collection {collection_name}: {', '.join(update)}")
+        client.update_collection(collection_name=collection_name, **update)
+
+    _ensure_payload_indexes(client, collection_name, existing=info.payload_schema or {})
+
+
+def _ensure_payload_indexes(client: QdrantClient, collection_name: str, existing: dict) -> None:
+    for field_name, schema in PAYLOAD_INDEXES.items():
+        if field_name not in existing:
+            client.create_payload_index(
+                collection_name=collection_name,
+                field_name=field_name,
+                field_schema=schema
+            )
@@ -0,0 +1,147 @@
+import inspect
+import logging
+import time
+from functools import wraps
+
+from celery.exceptions import Ignore
+from celery.signals import before_task_publish, task_postrun, task_prerun
+from django.conf import settings
+from django_redis import get_redis_connection
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# Ingestion is routed by upload size so one large PDF cannot hold up small ones
+INGEST_SMALL = 'ingest_small'
+INGEST_LARGE = 'ingest_large'
+EXTRACTION = 'extraction'
+STORAGE = 'storage'
+
+SIZE_ROUTED_TASKS = {
+    'documents.tasks.process_document',
+    'documents.tasks.reprocess_document',
+}
+
+TASK_QUEUES = {
+    'documents.tasks.extract_pdf_shard': EXTRACTION,
+    # Only PDFs with enough pages to be extracted in shards reach the chord callback
+    'documents.tasks.ingest_extracted_shards': INGEST_LARGE,
+    'documents.tasks.delete_document_vectors': STORAGE,
+    'documents.tasks.retry_vector_deletions': STORAGE,
+    'documents.tasks.reconcile_vectors': STORAGE,
+    'documents.tasks.reconcile_document_vectors': STORAGE,
+    'documents.tasks.strip_vector_payloads': STORAGE,
+    'documents.tasks.backfill_user_payloads': STORAGE,
+}
+
+SLOT_KEY_PREFIX = 'ingest:running:'
+
+
+def document_queue(document_id: int) -> str:
+    """Pick the ingestion queue of a document from its file size."""
+    from .models import Document  # runtime import to avoid circular import
+
+    file_size = Document.objects.filter(id=document_id).values_list('file_size', flat=True).first()
+    if file_size is not None and file_size >= settings.INGESTION_LARGE_FILE_BYTES:
+        return INGEST_LARGE
+    return INGEST_SMALL
+
+
+def route_task(name, args, kwargs, options, task=None, **kw):
+    """Celery router (CELERY_TASK_ROUTES); tasks not listed go to the default queue."""
+    if name in SIZE_ROUTED_TASKS:
+        document_id = kwargs.get('document_id', args[0] if args else None)
+        return {'queue': document_queue(document_id)}
+    if name in TASK_QUEUES:
+        return {'queue': TASK_QUEUES[name]}
+    return None
+
+
+def _acquire_slot(user_id: int) -> bool:
+    key = f"{SLOT_KEY_PREFIX}{user_id}"
+    try:
+        connection = get_redis_connection('default')
+        pipe = connection.pipeline()
+        pipe.incr(key)
+        # Slots of workers that died without releasing expire with the key
+        pipe.expire(key, settings.INGESTION_SLOT_TTL)
+        running, _ = pipe.execute()
+        if running <= settings.INGESTION_MAX_TASKS_PER_USER:
+            return True
+        connection.decr(key)
+        return False
+    except Exception as e:
+        logger.warning(f"Could not check the ingestion slots of user {user_id}: {e}")
+        return True
+
+
+def _release_slot(user_id: int) -> None:
+    try:
+        get_redis_connection('default').decr(f"{SLOT_KEY_PREFIX}{user_id}")
+    except Exception as e:
+        logger.warning(f"Could not release an ingestion slot of user {user_id}: {e}")
+
+
+def fair_share(task_function):
+    """Let a bound ingestion task run only while its user has a free slot.
+
+    At most INGESTION_MAX_TASKS_PER_USER tasks of one user run at once; others
+    are re-queued after INGESTION_FAIRNESS_DELAY seconds, which puts them behind
+    the work of other users already queued. Apply it under @shared_task(bind=True)
+    to a task with a `document_id` argument.
+    """
+    signature = inspect.signature(task_function)
+
+    @wraps(task_function)
+    def wrapper(task, *args, **kwargs):
+        from .models import Document  # runtime import to avoid circular import
+
+        document_id = signature.bind(task, *args, **kwargs).arguments['document_id']
+        user_id = Document.objects.filter(id=document_id).values_list('user_id', flat=True).first()
+        if user_id is None:
+            return task_function(task, *args, **kwargs)
+        if not _acquire_slot(user_id):
+            metrics.inc('ingestion_deferred_total', queue=_queue(task))
+            # Re-queued like a retry, but without counting one, so deferrals do not use up failure retries
+            task.signature_from_request(countdown=settings.INGESTION_FAIRNESS_DELAY).apply_async()
+            raise Ignore()
+        try:
+            return task_function(task, *args, **kwargs)
+        finally:
+            _release_slot(user_id)
+
+    return wrapper
+
+
+@before_task_publish.connect
+def stamp_published_at(headers=None, **kwargs):
+    # Read back as task.request.published_at to measure queue wait
+    if headers is not None:
+        headers['published_at'] = time.time()
+
+
+@task_prerun.connect
+def record_queue_wait(task_id=None, task=None, **kwargs):
+    task.request.started_at = time.perf_counter()
+    published_at = getattr(task.request, 'published_at', None)
+    if published_at is not None:
+        metrics.observe('celery_queue_wait_seconds', max(0.0, time.time() - published_at), queue=_queue(task))
+
+
+@task_postrun.connect
+def record_run_time(task_id=None, task=None, state=None, **kwargs):
+    started_at = getattr(task.request, 'started_at', None)
+    if started_at is not None:
+        metrics.observe(
+            'celery_task_run_seconds',
+            time.perf_counter() - started_at,
+            queue=_queue(task),
+            task=task.name.rsplit('.', 1)[-1],
+            state=state or ''
+        )
+
+
+def _queue(task) -> str:
+    delivery_info = task.request.delivery_info or {}
+    return delivery_info.get('routing_key') or 'direct'
@@ -0,0 +1,113 @@
+import hashlib
+import logging
+import time
+from array import array
+from typing import Any, Callable, Dict, List, Tuple
+
+from django.conf import settings
+from django.core.cache import caches
+
+from . import metrics
+from .cache_versions import document_version
+from .embedding_cache import normalize_text
+
+logger = logging.getLogger(__name__)
+
+Retrieval = Tuple[List[float], List[Dict[str, Any]]]  # (query embedding, retrieved chunks)
+
+
+class RetrievalCache:
+    """Short-lived cache of retrieval results keyed by (document, normalized query, top_k).
+
+    Entries go stale when the document's cache version is bumped (re-processing
+    or deletion). Concurrent misses for the same key are coalesced: the first
+    request takes a lock and retrieves, the others wait up to `wait` seconds for
+    its result before retrieving on their own.
+    """
+
+    def __init__(self, alias: str, ttl: int, lock_timeout: int, wait: float, poll_interval: float = 0.05):
+        self.alias = alias
+        self.ttl = ttl
+        self.lock_timeout = lock_timeout
+        self.wait = wait
+        self.poll_interval = poll_interval
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def _key(self, document_id: int, query: str, top_k: int) -> str:
+        digest = hashlib.sha256(normalize_text(query).casefold().encode('utf-8')).hexdigest()
+        return (
+            f"retrieval:{document_id}:v{document_version(document_id)}:"
+            f"{settings.RETRIEVAL_MODE}:{settings.VECTOR_BACKEND}:{top_k}:{digest}"
+        )
+
+    def get_or_retrieve(self, document_id: int, query: str, top_k: int, retrieve: Callable[[], Retrieval]) -> Retrieval:
+        """Return the cached retrieval for the query, or run `retrieve` and cache its result."""
+        key = self._key(document_id, query, top_k)
+        entry = self._get(key)
+        if entry is not None:
+            return self._hit(entry, 'hit')
+
+        try:
+            locked = self.cache.add(f"{key}:lock", 1, timeout=self.lock_timeout)
+        except Exception as e:
+            logger.warning(f"Retrieval cache lock failed: {e}")
+            locked = False
+        else:
+            if not locked:
+                deadline = time.monotonic() + self.wait
+                while time.monotonic() < deadline:
+                    time.sleep(self.poll_interval)
+                    entry = self._get(key)
+                    if entry is not None:
+                        return self._hit(entry, 'coalesced')
+
+        metrics.inc('retrieval_cache_requests_total', result='miss')
+        try:
+            started = time.perf_counter()
+            embedding, chunks = retrieve()
+            self._set(key, {
+                'embedding': array('f', embedding).tobytes(),
+                'chunks': chunks,
+                'seconds': time.perf_counter() - started,
+            })
+        finally:
+            if locked:
+                self._release(f"{key}:lock")
+        return embedding, chunks
+
+    def _get(self, key: str):
+        try:
+            return self.cache.get(key)
+        except Exception as e:
+            logger.warning(f"Retrieval cache read failed: {e}")
+            return None
+
+    def _set(self, key: str, entry: dict) -> None:
+        try:
+            self.cache.set(key, entry, timeout=self.ttl)
+        except Exception as e:
+            logger.warning(f"Retrieval cache write failed: {e}")
+
+    def _release(self, lock_key: str) -> None:
+        try:
+            self.cache.delete(lock_key)
+        except Exception as e:
+            logger.warning(f"Retrieval cache unlock failed: {e}")
+
+    def _hit(self, entry: dict, result: str) -> Retrieval:
+        metrics.inc('retrieval_cache_requests_total', result=result)
+        metrics.inc('retrieval_cache_seconds_saved_total', entry['seconds'])
+        embedding = array('f')
+        embedding.frombytes(entry['embedding'])
+        return embedding.tolist(), entry['chunks']
+
+
+retrieval_cache = RetrievalCache(
+    alias=settings.RETRIEVAL_CACHE_ALIAS,
+    ttl=settings.RETRIEVAL_CACHE_TTL,
+    lock_timeout=settings.RETRIEVAL_CACHE_LOCK_TIMEOUT,
+    wait=settings.RETRIEVAL_CACHE_WAIT,
+)
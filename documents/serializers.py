@@ -1,33 +1,58 @@
+from django.conf import settings
 from rest_framework import serializers
 from .models import Document, DocumentChunk, Conversation, Message
 
 class DocumentSerializer(serializers.ModelSerializer):
     conversation = serializers.IntegerField(source='conversation.id', read_only=True)
+    processed = serializers.BooleanField(read_only=True)
     class Meta:
         model = Document
-        fields = ['id', 'title', 'file', 'uploaded_at', 'processed', 'user', 'file_size','conversation']
-        read_only_fields = ['uploaded_at', 'processed', 'user']
+        fields = [
+            'id', 'title', 'file', 'uploaded_at', 'processed', 'status', 'chunks_done', 'chunks_total', 'error',
+            'user', 'file_size', 'conversation'
+        ]
+        read_only_fields = ['uploaded_at', 'status', 'chunks_done', 'chunks_total', 'error', 'user', 'file_size']
 
     def create(self, validated_data):
         # Set the user from the request context
         validated_data['user'] = self.context['request'].user
         return super().create(validated_data)
 
+class DocumentStatusSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Document
+        fields = ['id', 'status', 'chunks_done', 'chunks_total', 'error']
+        read_only_fields = fields
+
 class DocumentChunkSerializer(serializers.ModelSerializer):
     class Meta:
         model = DocumentChunk
-        fields = ['id', 'document', 'content', 'chunk_number', 'created_at']
+        fields = ['id', 'document', 'content', 'chunk_number', 'page_start', 'page_end', 'created_at']
         read_only_fields = ['created_at']
 
 class ChatInputSerializer(serializers.Serializer):
     message = serializers.CharField(required=True, max_length=2000)
 
+class BatchChatInputSerializer(serializers.Serializer):
+    questions = serializers.ListField(
+        child=serializers.CharField(max_length=2000),
+        min_length=1,
+        max_length=settings.CHAT_BATCH_MAX_QUESTIONS
+    )
+
 class MessageSerializer(serializers.ModelSerializer):
     class Meta:
         model = Message
         fields = ['id', 'conversation', 'role', 'content', 'created_at']
         read_only_fields = ['created_at']
 
+    def __init__(self, *args, fields=None, **kwargs):
+        # Optionally serialize only a subset of the fields
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
 class ChatOutputSerializer(serializers.ModelSerializer):
     class Meta:
         model = Message
@@ -35,13 +60,22 @@ class ChatOutputSerializer(serializers.ModelSerializer):
         read_only_fields = ['role', 'content', 'created_at']
 
 class ConversationSerializer(serializers.ModelSerializer):
-    document_title = serializers.CharField(source='document.title', read_only=True)
+    document_title = serializers.CharField(source='document.title', read_only=True, allow_null=True)
 
     class Meta:
         model = Conversation
-        fields = ['id', 'document', 'document_title', 'user', 'created_at', 'updated_at']
+        fields = ['id', 'document', 'document_title', 'scope', 'user', 'created_at', 'updated_at']
         read_only_fields = ['created_at', 'updated_at', 'user']
 
+    def validate(self, attrs):
+        scope = attrs.get('scope', self.instance.scope if self.instance else 'document')
+        document = attrs.get('document', self.instance.document if self.instance else None)
+        if scope == 'document' and document is None:
+            raise serializers.ValidationError({'document': "Document conversations need a document."})
+        if scope == 'library' and document is not None:
+            raise serializers.ValidationError({'document': "Library conversations search all documents; leave it empty."})
+        return attrs
+
     def create(self, validated_data):
         # Set the user from the request context
         validated_data['user'] = self.context['request'].user
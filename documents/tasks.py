@@ -1,41 +1,430 @@
-from celery import shared_task
+import requests
+from celery import chord, shared_task
+from django.conf import settings
+from django.db import OperationalError
+from qdrant_client.http.exceptions import ResponseHandlingException
+from django.core.files.base import ContentFile, File
 from django.core.files.storage import default_storage
-from .models import Document
-from .utils import extract_text_from_pdf, create_text_chunks, generate_embeddings, store_document_chunks
+from .models import Document, VectorDeletion
+from .cache_versions import bump_document_version
+from .embedding_scheduler import EmbeddingScheduler, is_retryable
+from .metrics import IngestionRecorder, stage
+from .queues import fair_share
+from .vector_store import get_vector_store
+from .chunking import Chunk
+from .utils import (
+    iter_pdf_pages, iter_chunks, batched, generate_embeddings, store_document_chunks,
+    count_pdf_pages, page_ranges, extract_page_range, ChunkIdentifier, renumber_chunks,
+    find_processed_twin, clone_document_chunks, find_orphaned_vectors, delete_vectors, set_payload_user,
+    strip_payload_content
+)
 import asyncio
+import json
 import logging
+import tempfile
+from typing import List
 
 # Set up a logger
 logger = logging.getLogger(__name__)
 
-@shared_task
-def process_document(document_id: int) -> None:
-    """Process a PDF document: extract text, create chunks, generate embeddings, and store in database."""
+CHECKPOINT_DIR = 'checkpoints'
+
+class TransientIngestionError(Exception):
+    """An ingestion attempt failed on an error worth retrying; the original error is its __cause__."""
+
+
+# Failures worth retrying: the embedding API, Qdrant or PostgreSQL being unreachable, and the
+# embedding API's rate limits and server errors (see is_transient). Unreadable PDFs and other
+# errors fail the document at once.
+TRANSIENT_ERRORS = (
+    requests.ConnectionError,
+    requests.Timeout,
+    ResponseHandlingException,  # Qdrant transport errors
+    OperationalError,
+    TransientIngestionError,
+)
+
+
+def is_transient(error: Exception) -> bool:
+    # The NVIDIA client raises 429 and 5xx responses as plain Exceptions, recognized by their status
+    return isinstance(error, TRANSIENT_ERRORS) or is_retryable(error)
+
+
+# Retried with exponential backoff; resumed runs skip the chunks already stored
+INGESTION_RETRY = {
+    'autoretry_for': TRANSIENT_ERRORS,
+    'retry_backoff': True,
+    'retry_backoff_max': 600,
+    'max_retries': settings.INGESTION_MAX_RETRIES,
+}
+
+
+def chunk_checkpoint_path(document_id: int) -> str:
+    return f"{CHECKPOINT_DIR}/{document_id}/chunks.jsonl"
+
+
+def has_chunk_checkpoint(document) -> bool:
+    return document.chunks_total is not None and default_storage.exists(chunk_checkpoint_path(document.id))
+
+
+def write_chunk_checkpoint(document, pages, recorder: IngestionRecorder) -> int:
+    """Chunk a stream of page texts into the document's chunk checkpoint; return the number of chunks.
+
+    Chunks are spooled to a temporary file and saved to storage in one piece,
+    so a checkpoint either holds every chunk or does not exist.
+    """
+    batches = batched(iter_chunks(recorder.count_pages(pages)), settings.INGESTION_BATCH_SIZE)
+    count = 0
+    with tempfile.TemporaryFile() as spool:
+        while (batch := recorder.next_batch(batches)) is not None:
+            recorder.add_chunks(batch, sum(chunk.tokens for chunk in batch))
+            for chunk in batch:
+                spool.write(json.dumps(chunk).encode('utf-8') + b'\n')
+            count += len(batch)
+        spool.seek(0)
+        path = chunk_checkpoint_path(document.id)
+        default_storage.delete(path)
+        default_storage.save(path, File(spool))
+    return count
+
+
+def iter_chunk_checkpoint(document_id: int):
+    """Yield the chunks of a document's chunk checkpoint in order."""
+    with default_storage.open(chunk_checkpoint_path(document_id)) as checkpoint:
+        for line in checkpoint:
+            yield Chunk(*json.loads(line))
+
+
+def embed_chunk_checkpoint(document, recorder: IngestionRecorder) -> None:
+    """Embed and store the checkpointed chunks in batches, skipping the first `chunks_done`."""
+    identifier = ChunkIdentifier(document.id)
+    scheduler = EmbeddingScheduler.from_settings()
+    done = document.chunks_done
+
+    chunk_number = 0
+    for batch in batched(iter_chunk_checkpoint(document.id), settings.INGESTION_BATCH_SIZE):
+        # Ids are drawn for skipped chunks too, so repeated texts keep their occurrence numbers
+        vector_ids = [identifier(chunk.text) for chunk in batch]
+        pending = [i for i in range(len(batch)) if chunk_number + i >= done]
+        if pending:
+            texts = [batch[i].text for i in pending]
+            
+            # Run async function (generate_embeddings) synchronously using asyncio
+            with stage('embed'):
+                embeddings = asyncio.run(generate_embeddings(texts, scheduler))  # Running async function in sync task
+            
+            # Store this batch of chunks and embeddings
+            store_document_chunks(
+                document,
+                texts,
+                embeddings,
+                vector_ids=[vector_ids[i] for i in pending],
+                chunk_numbers=[chunk_number + i for i in pending],
+                page_spans=[(batch[i].page_start, batch[i].page_end) for i in pending]
+            )
+        chunk_number += len(batch)
+        if pending:
+            document.set_status('embedding', chunks_done=chunk_number)
+    recorder.retries = scheduler.retries
+
+
+def ingest_pages(document, pages, recorder: IngestionRecorder) -> None:
+    """Chunk a stream of page texts, embed and store the chunks in batches, and mark the document ready.
+
+    The chunks are checkpointed before embedding. When a checkpoint from an
+    earlier attempt exists, `pages` is not read and embedding resumes after the
+    last stored batch.
+    """
+    if not has_chunk_checkpoint(document):
+        document.set_status('chunking', chunks_total=None, chunks_done=0)
+        chunks_total = write_chunk_checkpoint(document, pages, recorder)
+        document.set_status('embedding', chunks_total=chunks_total)
+    else:
+        document.set_status('embedding')
+    
+    embed_chunk_checkpoint(document, recorder)
+    
+    document.set_status('ready', chunks_done=document.chunks_total, error='')
+    default_storage.delete(chunk_checkpoint_path(document.id))
+    
+    # Answers cached for an earlier version of this document are now stale
+    bump_document_version(document.id)
+
+
+def record_failure(task, document_id: int, error: Exception) -> None:
+    """Keep the error on the document; it is failed unless the error is transient and retries are left.
+
+    Pass `task` None where no retry follows, as in an error callback.
+    """
+    fields = {'error': str(error)}
+    if task is None or not is_transient(error) or task.request.retries >= task.max_retries:
+        fields['status'] = 'failed'
+    Document.objects.filter(id=document_id).update(**fields)
+
+
+@shared_task(bind=True, acks_late=True, **INGESTION_RETRY)
+@fair_share
+def process_document(self, document_id: int) -> None:
+    """Process a PDF document: extract text, create chunks, generate embeddings, and store in database.
+
+    Pages are read lazily and chunked as they arrive into a chunk checkpoint;
+    chunks are embedded and stored in micro-batches, so memory use does not
+    grow with document size. Large PDFs are extracted in parallel page-range
+    shards first. A retry resumes from the checkpoint.
+    """
     try:
         # Get the document object
         document = Document.objects.get(id=document_id)
         
+        # Reuse the chunks and vectors of an identical, already processed upload
+        twin = find_processed_twin(document)
+        if twin is not None:
+            with IngestionRecorder(document, 'clone').record():
+                clone_document_chunks(twin, document)
+                document.set_status('ready', chunks_total=twin.chunks_total, chunks_done=twin.chunks_total, error='')
+                bump_document_version(document.id)
+            return
+        
+        # Extraction and chunking were done by an earlier attempt
+        if has_chunk_checkpoint(document):
+            with IngestionRecorder(document, 'resumed').record() as recorder:
+                ingest_pages(document, [], recorder)
+            return
+        
         # Get the file path
         file_path = document.file.path
+        document.set_status('extracting')
         
-        # Extract text from PDF
-        text = extract_text_from_pdf(file_path)
+        page_count = count_pdf_pages(file_path)
+        if settings.PDF_EXTRACTION_WORKERS > 1 and page_count >= settings.PDF_PARALLEL_MIN_PAGES:
+            # Extract page ranges as parallel subtasks, then ingest them in order
+            shards = page_ranges(page_count, settings.PDF_EXTRACTION_WORKERS)
+            # If a shard fails the callback never runs; its error callback fails the document instead
+            chord(
+                extract_pdf_shard.s(document_id, start, end) for start, end in shards
+            )(ingest_extracted_shards.s(document_id).on_error(fail_sharded_ingestion.s(document_id)))
+            return
         
-        # Create text chunks
-        text_chunks = create_text_chunks(text)
+        # Lazily extract pages and ingest them
+        with IngestionRecorder(document, 'full').record() as recorder:
+            ingest_pages(document, iter_pdf_pages(file_path), recorder)
         
-        # Run async function (generate_embeddings) synchronously using asyncio
-        embeddings = asyncio.run(generate_embeddings(text_chunks))  # Running async function in sync task
+    except Document.DoesNotExist:
+        logger.error(f"Document with id {document_id} does not exist")
+    except Exception as e:
+        logger.error(f"Error processing document {document_id}: {str(e)}")
+        record_failure(self, document_id, e)
+        if is_transient(e) and not isinstance(e, TRANSIENT_ERRORS):
+            raise TransientIngestionError(str(e)) from e
+        raise
+
+
+@shared_task(acks_late=True)
+def extract_pdf_shard(document_id: int, start: int, end: int) -> str:
+    """Extract pages [start, end) of a document's PDF and save them to storage; return the shard path."""
+    document = Document.objects.get(id=document_id)
+    with stage('extract_shard'):
+        pages = extract_page_range(document.file.path, start, end)
+    return default_storage.save(
+        f"extracted/{document_id}/{start:06d}.json",
+        ContentFile(json.dumps(pages).encode('utf-8'))
+    )
+
+
+@shared_task
+def fail_sharded_ingestion(request, exc, traceback, document_id: int) -> None:
+    """Error callback of the shard chord: a shard or the ingestion callback failed for good."""
+    logger.error(f"Sharded ingestion of document {document_id} failed: {exc}")
+    record_failure(None, document_id, exc)
+
+
+def iter_shard_pages(shard_paths: List[str]):
+    """Yield pages from extracted shards in order, loading one shard at a time."""
+    for path in shard_paths:
+        with default_storage.open(path) as shard:
+            yield from json.load(shard)
+
+
+@shared_task(bind=True, acks_late=True, **INGESTION_RETRY)
+@fair_share
+def ingest_extracted_shards(self, shard_paths: List[str], document_id: int) -> None:
+    """Chord callback: ingest the pages of the extracted shards in page order.
+
+    The shards are kept until ingestion succeeds, so a retry does not extract again.
+    """
+    try:
+        document = Document.objects.get(id=document_id)
+        with IngestionRecorder(document, 'sharded').record() as recorder:
+            ingest_pages(document, iter_shard_pages(shard_paths), recorder)
+        for path in shard_paths:
+            default_storage.delete(path)
+    except Document.DoesNotExist:
+        logger.error(f"Document with id {document_id} does not exist")
+    except Exception as e:
+        logger.error(f"Error processing document {document_id}: {str(e)}")
+        record_failure(self, document_id, e)
+        if is_transient(e) and not isinstance(e, TRANSIENT_ERRORS):
+            raise TransientIngestionError(str(e)) from e
+        raise
+
+
+@shared_task(bind=True, acks_late=True, **INGESTION_RETRY)
+@fair_share
+def reprocess_document(self, document_id: int) -> None:
+    """Re-ingest a document, embedding only chunks whose identity changed.
+
+    Unchanged chunks are kept (and renumbered if they moved), new chunks are
+    embedded and stored, and chunks that no longer exist are deleted in bulk.
+    Stored chunks count as unchanged, so a retry resumes where it failed.
+    """
+    try:
+        document = Document.objects.get(id=document_id)
+        existing = dict(document.chunks.exclude(vector_id=None).values_list('vector_id', 'chunk_number'))
+        identifier = ChunkIdentifier(document.id)
+        scheduler = EmbeddingScheduler.from_settings()
+        seen = set()
+        moved = []
+        added = 0
+        
+        # A checkpoint left by a failed first ingestion is of an older file version
+        default_storage.delete(chunk_checkpoint_path(document.id))
+        document.set_status('embedding', chunks_total=None, chunks_done=0)
         
-        # Store chunks and embeddings
-        store_document_chunks(document, text_chunks, embeddings)
+        with IngestionRecorder(document, 'incremental').record() as recorder:
+            pages = recorder.count_pages(iter_pdf_pages(document.file.path))
+            batches = batched(iter_chunks(pages), settings.INGESTION_BATCH_SIZE)
+            chunk_number = 0
+            while (batch := recorder.next_batch(batches)) is not None:
+                vector_ids = [identifier(chunk.text) for chunk in batch]
+                numbers = range(chunk_number, chunk_number + len(batch))
+                seen.update(vector_ids)
+                moved.extend(
+                    (vector_id, number) for vector_id, number in zip(vector_ids, numbers)
+                    if vector_id in existing and existing[vector_id] != number
+                )
+                
+                new = [i for i, vector_id in enumerate(vector_ids) if vector_id not in existing]
+                if new:
+                    new_chunks = [batch[i] for i in new]
+                    recorder.add_chunks(new_chunks, sum(chunk.tokens for chunk in new_chunks))
+                    with stage('embed'):
+                        embeddings = asyncio.run(generate_embeddings([chunk.text for chunk in new_chunks], scheduler))
+                    store_document_chunks(
+                        document,
+                        [chunk.text for chunk in new_chunks],
+                        embeddings,
+                        vector_ids=[vector_ids[i] for i in new],
+                        chunk_numbers=[numbers[i] for i in new],
+                        page_spans=[(chunk.page_start, chunk.page_end) for chunk in new_chunks]
+                    )
+                    added += len(new)
+                chunk_number += len(batch)
+                document.set_status('embedding', chunks_done=chunk_number)
+            recorder.retries = scheduler.retries
+            
+            renumber_chunks(document, moved)
+            
+            removed = [vector_id for vector_id in existing if vector_id not in seen]
+            for batch in batched(removed, 1000):
+                # Queryset delete queues one bulk vector delete per batch
+                document.chunks.filter(vector_id__in=batch).delete()
+            
+            document.set_status('ready', chunks_total=chunk_number, chunks_done=chunk_number, error='')
+            bump_document_version(document.id)
         
-        # Mark document as processed
-        document.processed = True
-        document.save()
+        logger.info(
+            f"Reprocessed document {document_id}: {added} new, "
+            f"{len(moved)} moved, {len(removed)} removed chunks"
+        )
         
     except Document.DoesNotExist:
         logger.error(f"Document with id {document_id} does not exist")
     except Exception as e:
-        logger.error(f"Error processing document {document_id}: {str(e)}")
+        logger.error(f"Error reprocessing document {document_id}: {str(e)}")
+        record_failure(self, document_id, e)
+        if is_transient(e) and not isinstance(e, TRANSIENT_ERRORS):
+            raise TransientIngestionError(str(e)) from e
         raise
+
+
+@shared_task
+def reconcile_document_vectors(document_id: int) -> int:
+    """Delete Qdrant points of a document that no longer have a DocumentChunk row."""
+    try:
+        document = Document.objects.get(id=document_id)
+    except Document.DoesNotExist:
+        logger.error(f"Document with id {document_id} does not exist")
+        return 0
+
+    orphaned = find_orphaned_vectors(document)
+    if orphaned:
+        logger.warning(f"Deleting {len(orphaned)} orphaned vectors of document {document_id}")
+        delete_vectors(point_ids=orphaned)
+    return len(orphaned)
+
+
+@shared_task
+def reconcile_vectors() -> None:
+    """Queue a vector consistency check for every processed document."""
+    for document_id in Document.objects.filter(status='ready').values_list('id', flat=True).iterator():
+        reconcile_document_vectors.delay(document_id)
+
+
+@shared_task
+def strip_vector_payloads() -> None:
+    """Drop chunk text from the Qdrant payloads of all documents (run once after disabling CHUNK_CONTENT_IN_PAYLOAD)."""
+    if settings.CHUNK_CONTENT_IN_PAYLOAD:
+        logger.warning("CHUNK_CONTENT_IN_PAYLOAD is enabled; not stripping payloads")
+        return
+    for document_id in Document.objects.values_list('id', flat=True).iterator():
+        try:
+            strip_payload_content(document_id)
+        except Exception as e:
+            logger.error(f"Could not strip payloads of document {document_id}: {str(e)}")
+
+
+@shared_task
+def backfill_user_payloads() -> None:
+    """Add the `user_id` payload field to Qdrant points stored before library search existed (run once)."""
+    if not get_vector_store().external:
+        return  # pgvector searches join the document's user directly
+    for document_id, user_id in Document.objects.values_list('id', 'user_id').iterator():
+        try:
+            set_payload_user(document_id, user_id)
+        except Exception as e:
+            logger.error(f"Could not set the user of document {document_id} in Qdrant: {str(e)}")
+
+
+def queue_vector_deletion(document_id: int = None, point_ids: List[str] = None) -> None:
+    """Queue a bulk vector delete, falling back to the outbox if the broker is unavailable."""
+    if not get_vector_store().external:
+        return  # vectors were deleted with their rows
+    try:
+        delete_document_vectors.delay(document_id=document_id, point_ids=point_ids)
+    except Exception as e:
+        logger.error(f"Could not queue vector deletion: {str(e)}")
+        VectorDeletion.objects.create(document_id=document_id, point_ids=point_ids or [], last_error=str(e))
+
+
+@shared_task
+def delete_document_vectors(document_id: int = None, point_ids: List[str] = None) -> None:
+    """Delete vectors from Qdrant, recording failures in the outbox for retry."""
+    try:
+        delete_vectors(document_id=document_id, point_ids=point_ids)
+    except Exception as e:
+        logger.error(f"Error deleting vectors from Qdrant: {str(e)}")
+        VectorDeletion.objects.create(document_id=document_id, point_ids=point_ids or [], last_error=str(e))
+
+
+@shared_task
+def retry_vector_deletions(limit: int = 100) -> None:
+    """Retry vector deletes recorded in the outbox."""
+    for entry in VectorDeletion.objects.all()[:limit]:
+        try:
+            delete_vectors(document_id=entry.document_id, point_ids=entry.point_ids)
+        except Exception as e:
+            entry.attempts += 1
+            entry.last_error = str(e)
+            entry.save(update_fields=['attempts', 'last_error', 'updated_at'])
+        else:
+            entry.delete()
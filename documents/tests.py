@@ -0,0 +1,113 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+
+from .benchmarks import LOCAL_CACHES, FakeChatModel, FakeEmbeddings, bench_chat_stream, bench_messages
+from .clients import chat_key, embeddings_key, override_client
+from . import tasks
+from .models import Conversation, Document
+from .utils import EMBEDDING_MODEL, page_ranges
+from .views import CHAT_MODEL, CHAT_PARAMS
+
+
+@override_settings(CACHES=LOCAL_CACHES, METRICS_ENABLED=False, VECTOR_BACKEND='pgvector')
+class ChatStreamBenchmarkTests(TransactionTestCase):
+    # bench_chat_stream commits its own rows, so it cannot run inside a TestCase transaction
+
+    def test_concurrent_clients(self):
+        embedder = FakeEmbeddings()
+        chunks = [f"Clause {i} covers part number P-{i:05d} and its delivery terms." for i in range(20)]
+        questions = [f"Which clause covers part number P-{i:05d}?" for i in range(8)]
+        with override_client(embeddings_key(EMBEDDING_MODEL), embedder), \
+                override_client(chat_key(CHAT_MODEL, **CHAT_PARAMS), FakeChatModel(tokens=8)):
+            results = bench_chat_stream(chunks, questions, embedder, [1, 4])
+
+        self.assertEqual(set(results), {'1', '4'})
+        self.assertEqual(results['4']['requests'], 8)
+        self.assertEqual(results['4']['total']['n'], 8)
+        # Its user, document and conversation are deleted afterwards
+        self.assertFalse(Document.objects.exists())
+        self.assertFalse(Conversation.objects.exists())
+
+
+class MessagesBenchmarkTests(TestCase):
+
+    # The test runner adds 'testserver' to ALLOWED_HOSTS; run with the hosts from core/settings.py
+    @override_settings(ALLOWED_HOSTS=['localhost'])
+    def test_pages_under_project_allowed_hosts(self):
+        user = get_user_model().objects.create_user(username='reader', email='reader@example.com')
+        document = Document.objects.create(title='contract', file='documents/contract.pdf', user=user)
+        conversation = Conversation.objects.create(document=document, user=user)
+
+        results = bench_messages(conversation, count=45, page_size=10, samples=3)
+
+        self.assertEqual(results['cursor']['pages'], 5)
+
+
+class PageRangesTests(SimpleTestCase):
+
+    def test_splits_pages_into_contiguous_ranges(self):
+        self.assertEqual(page_ranges(10, 4), [(0, 3), (3, 6), (6, 9), (9, 10)])
+        self.assertEqual(page_ranges(3, 8), [(0, 1), (1, 2), (2, 3)])
+
+    def test_empty_pdf_has_no_ranges(self):
+        self.assertEqual(page_ranges(0, 4), [])
+
+
+@override_settings(CACHES=LOCAL_CACHES, PDF_EXTRACTION_WORKERS=4, PDF_PARALLEL_MIN_PAGES=200)
+class ShardedIngestionTests(TestCase):
+
+    def test_failed_shard_fails_the_document(self):
+        user = get_user_model().objects.create_user(username='uploader', email='uploader@example.com')
+        document = Document.objects.create(title='manual', file='documents/manual.pdf', user=user)
+
+        with mock.patch.object(tasks, 'count_pdf_pages', return_value=400), \
+                mock.patch.object(tasks, 'chord') as chord:
+            tasks.process_document(document.id)
+        [header], _ = chord.call_args
+        [callback], _ = chord.return_value.call_args
+        self.assertEqual(len(list(header)), 4)
+
+        # What the result backend does when a chord header task fails
+        try:
+            raise ValueError("shard 2 could not be read")
+        except ValueError as e:
+            tasks.ingest_extracted_shards.backend.chord_error_from_stack(callback, e)
+
+        document.refresh_from_db()
+        self.assertEqual(document.status, 'failed')
+        self.assertEqual(document.error, "shard 2 could not be read")
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class IngestionRetryTests(TestCase):
+
+    def setUp(self):
+        user = get_user_model().objects.create_user(username='uploader', email='uploader@example.com')
+        self.document = Document.objects.create(title='manual', file='documents/manual.pdf', user=user)
+
+    def process(self, *outcomes):
+        with mock.patch.object(tasks, 'count_pdf_pages', return_value=3), \
+                mock.patch.object(tasks, 'ingest_pages', side_effect=outcomes) as ingest_pages:
+            result = tasks.process_document.apply(args=(self.document.id,))
+        self.document.refresh_from_db()
+        return result, ingest_pages.call_count
+
+    def test_embedding_api_503_is_retried(self):
+        # How the NVIDIA client reports a 503 once the embedding scheduler has run out of retries
+        unavailable = Exception("[503] Service Unavailable\nService Unavailable")
+
+        result, attempts = self.process(unavailable, None)
+
+        self.assertTrue(result.successful())
+        self.assertEqual(attempts, 2)
+        self.assertNotEqual(self.document.status, 'failed')
+
+    def test_other_errors_fail_at_once(self):
+        result, attempts = self.process(ValueError("PDF is encrypted"))
+
+        self.assertTrue(result.failed())
+        self.assertEqual(attempts, 1)
+        self.assertEqual(self.document.status, 'failed')
+        self.assertEqual(self.document.error, "PDF is encrypted")
@@ -1,106 +1,549 @@
+import asyncio
+import hashlib
+import operator
 import os
+import re
 import uuid
-from typing import List, Dict, Any, TYPE_CHECKING
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import reduce
+from itertools import islice
+from typing import List, Dict, Any, Iterable, Iterator, Tuple, TYPE_CHECKING
 from langchain_community.document_loaders import PyPDFLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_nvidia_ai_endpoints import NVIDIAEmbeddings
+from pypdf import PdfReader
 from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db.models import F
+from qdrant_client.http import models
 
-from .qdrant_client import qdrant_client, COLLECTION_NAME, models
+from .chunking import Chunk, TokenChunker, count_tokens, get_encoding
+from .embedding_cache import embedding_cache
+from .embedding_scheduler import EmbeddingScheduler
+from .retrieval_cache import retrieval_cache
+from .metrics import stage
+from .clients import get_client, get_embeddings
+from .qdrant_client import get_qdrant_client, COLLECTION_NAME
+from .vector_store import get_vector_store
 
 if TYPE_CHECKING:
     from .models import DocumentChunk
 
+EMBEDDING_MODEL = "NV-Embed-QA"
+
+
+def compute_file_digest(file) -> str:
+    """Return the SHA-256 hex digest of an uploaded file."""
+    digest = hashlib.sha256()
+    for block in file.chunks():
+        digest.update(block)
+    return digest.hexdigest()
+
+
+def iter_pdf_pages(pdf_path: str) -> Iterator[str]:
+    """Lazily yield the text of each page of a PDF file."""
+    loader = PyPDFLoader(pdf_path)
+    for page in loader.lazy_load():
+        yield page.page_content
+
+
+def count_pdf_pages(pdf_path: str) -> int:
+    """Return the number of pages of a PDF file."""
+    return len(PdfReader(pdf_path).pages)
+
+
+def page_ranges(page_count: int, shards: int) -> List[Tuple[int, int]]:
+    """Split `page_count` pages into at most `shards` contiguous [start, end) ranges."""
+    if page_count <= 0:
+        return []
+    size = -(-page_count // max(1, shards))
+    return [(start, min(start + size, page_count)) for start in range(0, page_count, size)]
+
+
+def extract_page_range(pdf_path: str, start: int, end: int) -> List[str]:
+    """Extract the text of pages [start, end) of a PDF file."""
+    reader = PdfReader(pdf_path)
+    return [reader.pages[i].extract_text() for i in range(start, end)]
+
+
+def extract_pdf_pages_parallel(pdf_path: str, workers: int) -> Iterator[str]:
+    """Extract the pages of a PDF file in a process pool, yielding them in page order.
+
+    Not usable inside Celery prefork workers (daemonic processes cannot have
+    children); the ingestion task shards extraction across subtasks instead.
+    """
+    shards = page_ranges(count_pdf_pages(pdf_path), workers)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(extract_page_range, pdf_path, start, end) for start, end in shards]
+        for future in futures:
+            yield from future.result()
+
 
 def extract_text_from_pdf(pdf_path: str) -> str:
     """Extract text content from a PDF file."""
-    loader = PyPDFLoader(pdf_path)
-    pages = loader.load()
-    return ''.join(page.page_content for page in pages)
+    return ''.join(iter_pdf_pages(pdf_path))
 
 
-def create_text_chunks(text: str, chunk_size: int = 1000, chunk_overlap: int = 200) -> List[str]:
-    """Split text into chunks using LangChain's text splitter."""
-    splitter = RecursiveCharacterTextSplitter(
+def _text_splitter(chunk_size: int, chunk_overlap: int) -> RecursiveCharacterTextSplitter:
+    return RecursiveCharacterTextSplitter(
         chunk_size=chunk_size,
         chunk_overlap=chunk_overlap,
         add_start_index=True,
         length_function=len,
         separators=["\n\n", "\n", " ", ""]
     )
-    return splitter.split_text(text)
 
 
-async def generate_embeddings(text_chunks: List[str]) -> List[List[float]]:
-    """Generate embeddings for text chunks using NVIDIA's API in batch."""
-    embeddings = NVIDIAEmbeddings(model="NV-Embed-QA", api_key=settings.NVIDIA_API_KEY)
-    return await embeddings.aembed_documents(text_chunks)
+def create_text_chunks(text: str, chunk_size: int = 1000, chunk_overlap: int = 200) -> List[str]:
+    """Split text into chunks using LangChain's text splitter."""
+    return _text_splitter(chunk_size, chunk_overlap).split_text(text)
+
+
+def iter_text_chunks(pages: Iterable[str], chunk_size: int = None, chunk_overlap: int = None) -> Iterator[str]:
+    """Split a stream of page texts into chunks as the pages arrive.
+
+    The last chunk of each page is held back and re-split together with the
+    next page, so chunks still span page boundaries the same way they would
+    if the whole document had been joined first.
+    """
+    splitter = _text_splitter(
+        settings.CHUNK_SIZE if chunk_size is None else chunk_size,
+        settings.CHUNK_OVERLAP if chunk_overlap is None else chunk_overlap
+    )
+    carry = ''
+    for page in pages:
+        chunks = splitter.split_text(carry + page)
+        if not chunks:
+            continue
+        yield from chunks[:-1]
+        carry = chunks[-1]
+    if carry:
+        yield carry
+
+
+def iter_chunks(pages: Iterable[str]) -> Iterator[Chunk]:
+    """Chunk a stream of page texts with the configured chunker."""
+    if settings.CHUNKER == 'characters':
+        for text in iter_text_chunks(pages):
+            yield Chunk(text, None, None, count_tokens(text))
+        return
+    yield from TokenChunker(settings.CHUNK_TOKENS, settings.CHUNK_OVERLAP_TOKENS).split(pages)
+
+
+def batched(iterable: Iterable, size: int) -> Iterator[list]:
+    """Yield lists of at most `size` items from `iterable`."""
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
 
 
-def store_document_chunks(document, text_chunks: List[str], embeddings: List[List[float]]) -> None:
-    """Store document chunks and their embeddings in Qdrant and PostgreSQL."""
+async def generate_embeddings(text_chunks: List[str], scheduler: EmbeddingScheduler = None) -> List[List[float]]:
+    """Generate embeddings for text chunks using NVIDIA's API in batch.
+
+    Chunks already in the embedding cache are not sent to the API; the rest
+    are sent in bounded-concurrency batches by the embedding scheduler.
+    """
+    vectors = embedding_cache.get_many(EMBEDDING_MODEL, 'passage', text_chunks)
+    missing = [i for i, vector in enumerate(vectors) if vector is None]
+    if missing:
+        missing_chunks = [text_chunks[i] for i in missing]
+        embeddings = get_embeddings(EMBEDDING_MODEL)
+        scheduler = scheduler or EmbeddingScheduler.from_settings()
+        fresh = await scheduler.embed(missing_chunks, embeddings.aembed_documents)
+        embedding_cache.set_many(EMBEDDING_MODEL, 'passage', missing_chunks, fresh)
+        for i, vector in zip(missing, fresh):
+            vectors[i] = vector
+    return vectors
+
+
+def embed_query(query: str) -> List[float]:
+    """Embed a search query, using the embedding cache when possible."""
+    [vector] = embedding_cache.get_many(EMBEDDING_MODEL, 'query', [query])
+    if vector is None:
+        embeddings = get_embeddings(EMBEDDING_MODEL)
+        vector = embeddings.embed_query(query)
+        embedding_cache.set_many(EMBEDDING_MODEL, 'query', [query], [vector])
+    return vector
+
+
+def embed_queries(queries: List[str]) -> List[List[float]]:
+    """Embed several search queries concurrently, using the embedding cache when possible.
+
+    The embedding client takes one query per request, so the requests go
+    through the embedding scheduler one query at a time, with its bounded
+    concurrency and retries.
+    """
+    vectors = embedding_cache.get_many(EMBEDDING_MODEL, 'query', queries)
+    missing = [i for i, vector in enumerate(vectors) if vector is None]
+    if missing:
+        missing_queries = [queries[i] for i in missing]
+        embeddings = get_embeddings(EMBEDDING_MODEL)
+
+        async def embed_batch(batch: List[str]) -> List[List[float]]:
+            return [await embeddings.aembed_query(query) for query in batch]
+
+        scheduler = EmbeddingScheduler.from_settings(batch_size=1)
+        fresh = asyncio.run(scheduler.embed(missing_queries, embed_batch))
+        embedding_cache.set_many(EMBEDDING_MODEL, 'query', missing_queries, fresh)
+        for i, vector in zip(missing, fresh):
+            vectors[i] = vector
+    return vectors
+
+
+def chunker_key() -> str:
+    """Identify the chunker configuration; changing it changes every chunk id."""
+    if settings.CHUNKER == 'characters':
+        return f"recursive-chars:{settings.CHUNK_SIZE}:{settings.CHUNK_OVERLAP}"
+    return f"tokens:{get_encoding().name}:{settings.CHUNK_TOKENS}:{settings.CHUNK_OVERLAP_TOKENS}"
+
+
+class ChunkIdentifier:
+    """Assign deterministic vector ids to the chunks of a document, in order.
+
+    The id is a UUID5 of (document, chunker configuration, chunk text, and the
+    number of earlier identical chunks), so re-running ingestion produces the
+    same ids and upserts replace points instead of duplicating them.
+    """
+
+    def __init__(self, document_id: int, config_key: str = None):
+        self.prefix = f"{document_id}:{config_key or chunker_key()}"
+        self.seen = {}
+
+    def __call__(self, text: str) -> str:
+        digest = hashlib.sha256(text.encode('utf-8')).hexdigest()
+        occurrence = self.seen.get(digest, 0)
+        self.seen[digest] = occurrence + 1
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{self.prefix}:{occurrence}:{digest}"))
+
+
+def chunk_payload(document_id: int, chunk_number: int, content: str, user_id: int = None) -> Dict[str, Any]:
+    """Qdrant payload of a chunk: filter fields, plus the text only if CHUNK_CONTENT_IN_PAYLOAD is set."""
+    payload = {'document_id': document_id, 'chunk_number': chunk_number}
+    if user_id is not None:
+        payload['user_id'] = user_id
+    if settings.CHUNK_CONTENT_IN_PAYLOAD:
+        payload['content'] = content
+    return payload
+
+
+def store_document_chunks(document, text_chunks: List[str], embeddings: List[List[float]],
+                          vector_ids: List[str], chunk_numbers: Iterable[int],
+                          page_spans: Iterable[Tuple[int, int]] = None) -> None:
+    """Store document chunks in PostgreSQL and their embeddings in the vector store.
+
+    Storing is idempotent: points are upserted by id and rows that already
+    exist for the document are skipped.
+    """
     from .models import DocumentChunk  # runtime import to avoid circular import
 
     chunks = []
-    points = []
-
-    for i, (chunk, embedding) in enumerate(zip(text_chunks, embeddings)):
-        vector_id = str(uuid.uuid4())
-
-        points.append(models.PointStruct(
-            id=vector_id,
-            vector=embedding,
-            payload={
-                'document_id': document.id,
-                'chunk_number': i,
-                'content': chunk
-            }
-        ))
+    page_spans = page_spans or [(None, None)] * len(text_chunks)
 
+    for chunk, vector_id, i, (page_start, page_end) in zip(text_chunks, vector_ids, chunk_numbers, page_spans):
         chunks.append(DocumentChunk(
             document=document,
             content=chunk,
             chunk_number=i,
-            vector_id=vector_id
+            vector_id=vector_id,
+            page_start=page_start,
+            page_end=page_end
         ))
 
-    qdrant_client.upsert(
-        collection_name=COLLECTION_NAME,
-        points=points
-    )
+    store = get_vector_store()
+    store.add(document, chunks, embeddings)
 
-    DocumentChunk.objects.bulk_create(chunks)
+    with stage('postgres_bulk_create'):
+        if store.external:
+            DocumentChunk.objects.bulk_create(chunks, ignore_conflicts=True)
+        else:
+            # Rows stored while another backend was active get their embedding filled in
+            DocumentChunk.objects.bulk_create(
+                chunks,
+                update_conflicts=True,
+                unique_fields=['document', 'vector_id'],
+                update_fields=['embedding']
+            )
 
 
-def search_similar_chunks(query: str, document, top_k: int = 3) -> List[Dict[str, Any]]:
-    """Search for similar chunks using Qdrant vector similarity search."""
+def renumber_chunks(document, moved: List[Tuple[str, int]], batch_size: int = 256) -> None:
+    """Update the chunk number of existing chunks, given (vector_id, chunk_number) pairs."""
     from .models import DocumentChunk  # runtime import to avoid circular import
 
-    embeddings = NVIDIAEmbeddings(model="NV-Embed-QA", api_key=settings.NVIDIA_API_KEY)
-    query_embedding = embeddings.embed_query(query)
+    for batch in batched(moved, batch_size):
+        numbers = dict(batch)
+        chunks = list(document.chunks.filter(vector_id__in=numbers).only('id', 'vector_id'))
+        for chunk in chunks:
+            chunk.chunk_number = numbers[chunk.vector_id]
+        DocumentChunk.objects.bulk_update(chunks, ['chunk_number'])
+        get_vector_store().renumber(batch)
 
-    chunk_vector_ids = set(DocumentChunk.objects.filter(
-        document=document
-    ).values_list('vector_id', flat=True))
 
-    search_result = qdrant_client.search(
-        collection_name=COLLECTION_NAME,
-        query_vector=query_embedding,
-        query_filter=models.Filter(
-            must=[models.FieldCondition(
-                key="document_id",
-                match=models.MatchValue(value=document.id)
-            )]
-        ),
-        limit=top_k
+def find_processed_twin(document):
+    """Return an already processed document with the same file digest, if any."""
+    from .models import Document  # runtime import to avoid circular import
+
+    if not document.digest:
+        return None
+    return Document.objects.filter(
+        digest=document.digest,
+        status='ready'
+    ).exclude(id=document.id).first()
+
+
+def clone_document_chunks(source, target, batch_size: int = 256) -> None:
+    """Copy the chunks and vectors of `source` onto `target` without re-embedding."""
+    identifier = ChunkIdentifier(target.id)
+    chunks = source.chunks.order_by('chunk_number').only(
+        'content', 'chunk_number', 'vector_id', 'page_start', 'page_end'
     )
+    for batch in batched(chunks.iterator(chunk_size=batch_size), batch_size):
+        vectors = get_vector_store().get_vectors(source, [chunk.vector_id for chunk in batch if chunk.vector_id])
+        embeddings = [vectors.get(chunk.vector_id) for chunk in batch]
+
+        # Missing vectors are re-embedded (usually an embedding cache hit)
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            fresh = asyncio.run(generate_embeddings([batch[i].content for i in missing]))
+            for i, embedding in zip(missing, fresh):
+                embeddings[i] = embedding
+
+        store_document_chunks(
+            target,
+            [chunk.content for chunk in batch],
+            embeddings,
+            vector_ids=[identifier(chunk.content) for chunk in batch],
+            chunk_numbers=[chunk.chunk_number for chunk in batch],
+            page_spans=[(chunk.page_start, chunk.page_end) for chunk in batch]
+        )
+
+
+def attach_chunk_contents(document, hits: List[Dict[str, Any]], chunks=None) -> List[Dict[str, Any]]:
+    """Fill in the text of search hits that lack it with one batched PostgreSQL query.
+
+    Hits without a DocumentChunk row (vectors not yet reconciled) are dropped.
+    `chunks` replaces `document.chunks` as the rows to look in.
+    """
+    missing = [hit['vector_id'] for hit in hits if hit.get('content') is None]
+    if not missing:
+        return hits
+    chunks = document.chunks if chunks is None else chunks
+    contents = dict(chunks.filter(vector_id__in=missing).values_list('vector_id', 'content'))
+    return [
+        hit if hit.get('content') is not None else {**hit, 'content': contents[hit['vector_id']]}
+        for hit in hits
+        if hit.get('content') is not None or hit['vector_id'] in contents
+    ]
+
+
+def search_similar_chunks(query: str, document, top_k: int = 3, query_embedding: List[float] = None,
+                          with_content: bool = True) -> List[Dict[str, Any]]:
+    """Search for similar chunks in the configured vector store.
+
+    With Qdrant the search is scoped by the `document_id` payload filter alone;
+    agreement with PostgreSQL is checked out-of-band by `find_orphaned_vectors`.
+    Pass `query_embedding` when the query has already been embedded. Chunk text
+    is read from PostgreSQL unless the backend returned it; with
+    `with_content=False` hits may have `content` None.
+    """
+    if query_embedding is None:
+        query_embedding = embed_query(query)
+
+    hits = get_vector_store().search(document, query_embedding, top_k)
+    return attach_chunk_contents(document, hits) if with_content else hits
+
+
+def search_lexical_chunks(query: str, document, top_k: int = 3) -> List[Dict[str, Any]]:
+    """Search chunks with PostgreSQL full-text search, ranked by ts_rank.
+
+    Query terms are OR-ed so long questions still match chunks that contain
+    only the rare terms, such as identifiers or clause numbers.
+    """
+    return _lexical_search(document.chunks.all(), query, top_k)
+
+
+def _lexical_search(chunks, query: str, top_k: int, with_document: bool = False) -> List[Dict[str, Any]]:
+    terms = re.findall(r'\w[\w.-]*', query)[:32]
+    if not terms:
+        return []
+    search_query = reduce(operator.or_, (SearchQuery(term, config='english') for term in terms))
+
+    rows = chunks.filter(
+        search_vector=search_query
+    ).annotate(
+        rank=SearchRank(F('search_vector'), search_query)
+    ).order_by('-rank').values('vector_id', 'content', 'chunk_number', 'document_id', 'rank')[:top_k]
 
     return [
         {
-            'content': hit.payload['content'],
-            'chunk_number': hit.payload['chunk_number'],
-            'distance': hit.score
+            'vector_id': row['vector_id'],
+            'content': row['content'],
+            'chunk_number': row['chunk_number'],
+            'rank': row['rank'],
+            **({'document_id': row['document_id']} if with_document else {})
         }
-        for hit in search_result
-        if hit.id in chunk_vector_ids
+        for row in rows
     ]
+
+
+def reciprocal_rank_fusion(result_lists: List[List[Dict[str, Any]]], k: int = 60) -> List[Dict[str, Any]]:
+    """Merge ranked result lists by summing 1 / (k + rank) per chunk."""
+    fused = {}
+    for results in result_lists:
+        for rank, hit in enumerate(results, start=1):
+            entry = fused.setdefault(hit['vector_id'], {**hit, 'score': 0.0})
+            entry['score'] += 1.0 / (k + rank)
+    return sorted(fused.values(), key=lambda hit: hit['score'], reverse=True)
+
+
+def _retrieval_executor() -> ThreadPoolExecutor:
+    return get_client(('executor', 'retrieval'), lambda: ThreadPoolExecutor(max_workers=4))
+
+
+def hybrid_search_chunks(query: str, document, top_k: int = 3, query_embedding: List[float] = None) -> List[Dict[str, Any]]:
+    """Run vector and full-text search in parallel and merge them with reciprocal rank fusion.
+
+    Only network calls go to the worker thread. A pgvector search stays on the
+    calling thread, which owns the database connection and its open transaction.
+    """
+    candidates = max(top_k, settings.HYBRID_CANDIDATES)
+    if get_vector_store().external:
+        dense_future = _retrieval_executor().submit(
+            search_similar_chunks, query, document, candidates, query_embedding, False
+        )
+        lexical = search_lexical_chunks(query, document, candidates)
+        dense = dense_future.result()
+    else:
+        embedding_future = None if query_embedding is not None else _retrieval_executor().submit(embed_query, query)
+        lexical = search_lexical_chunks(query, document, candidates)
+        if embedding_future is not None:
+            query_embedding = embedding_future.result()
+        dense = search_similar_chunks(query, document, candidates, query_embedding, with_content=False)
+    return attach_chunk_contents(document, _fuse(dense, lexical, top_k))
+
+
+def _fuse(dense: List[Dict[str, Any]], lexical: List[Dict[str, Any]], top_k: int) -> List[Dict[str, Any]]:
+    # Lexical hits already carry their text, so the remaining ones are fetched after fusion
+    lexical_contents = {hit['vector_id']: hit['content'] for hit in lexical}
+    fused = reciprocal_rank_fusion([dense, lexical], k=settings.RRF_K)[:top_k]
+    for hit in fused:
+        if hit.get('content') is None:
+            hit['content'] = lexical_contents.get(hit['vector_id'])
+    return fused
+
+
+def retrieve_chunks(query: str, document, top_k: int = 3, query_embedding: List[float] = None) -> List[Dict[str, Any]]:
+    """Retrieve context chunks for a query using the configured RETRIEVAL_MODE."""
+    if settings.RETRIEVAL_MODE == 'hybrid':
+        return hybrid_search_chunks(query, document, top_k, query_embedding)
+    return search_similar_chunks(query, document, top_k, query_embedding)
+
+
+def retrieve_chunks_batch(queries: List[str], document, top_k: int = 3,
+                          query_embeddings: List[List[float]] = None) -> List[List[Dict[str, Any]]]:
+    """Retrieve context chunks for several queries at once, in query order.
+
+    The vector searches go to the store in one batch and missing chunk text
+    is read with a single PostgreSQL query for all of them.
+    """
+    if query_embeddings is None:
+        query_embeddings = embed_queries(queries)
+
+    hybrid = settings.RETRIEVAL_MODE == 'hybrid'
+    candidates = max(top_k, settings.HYBRID_CANDIDATES) if hybrid else top_k
+    results = get_vector_store().search_many(document, query_embeddings, candidates)
+    if hybrid:
+        results = [
+            _fuse(dense, search_lexical_chunks(query, document, candidates), top_k)
+            for query, dense in zip(queries, results)
+        ]
+
+    attached = attach_chunk_contents(document, [hit for hits in results for hit in hits])
+    contents = {hit['vector_id']: hit['content'] for hit in attached}
+    return [
+        [{**hit, 'content': contents[hit['vector_id']]} for hit in hits if hit['vector_id'] in contents]
+        for hits in results
+    ]
+
+
+def cached_retrieve(query: str, document, top_k: int = 3) -> Tuple[List[float], List[Dict[str, Any]]]:
+    """Embed a query and retrieve its chunks, through the short-lived retrieval cache."""
+    def retrieve():
+        query_embedding = embed_query(query)
+        return query_embedding, retrieve_chunks(query, document, top_k, query_embedding)
+
+    return retrieval_cache.get_or_retrieve(document.id, query, top_k, retrieve)
+
+
+def search_library_chunks(query: str, user_id: int, documents: int = None, per_document: int = None,
+                          query_embedding: List[float] = None) -> List[Dict[str, Any]]:
+    """Retrieve context chunks for a query from all documents of a user.
+
+    The vector search is a single search filtered by the `user_id` payload,
+    grouped by document so that no single document fills the context. Hits
+    carry `document_id` and `document_title`.
+    """
+    from .models import Document, DocumentChunk  # runtime import to avoid circular import
+    from .vector_store import diversify  # runtime import to avoid circular import
+
+    documents = documents or settings.LIBRARY_MAX_DOCUMENTS
+    per_document = per_document or settings.LIBRARY_CHUNKS_PER_DOCUMENT
+    if query_embedding is None:
+        query_embedding = embed_query(query)
+
+    library_chunks = DocumentChunk.objects.filter(document__user_id=user_id)
+    if settings.RETRIEVAL_MODE == 'hybrid':
+        candidates = max(documents * per_document, settings.HYBRID_CANDIDATES)
+        dense = get_vector_store().search_library(user_id, query_embedding, candidates, per_document)
+        lexical = _lexical_search(library_chunks, query, candidates, with_document=True)
+        hits = diversify(_fuse(dense, lexical, len(dense) + len(lexical)), documents, per_document)
+    else:
+        hits = get_vector_store().search_library(user_id, query_embedding, documents, per_document)
+
+    hits = attach_chunk_contents(None, hits, chunks=library_chunks)
+    titles = dict(Document.objects.filter(id__in={hit['document_id'] for hit in hits}).values_list('id', 'title'))
+    return [{**hit, 'document_title': titles.get(hit['document_id'], '')} for hit in hits]
+
+
+def find_orphaned_vectors(document, page_size: int = 1000) -> List[str]:
+    """Return ids of vectors stored for `document` that have no matching DocumentChunk."""
+    store = get_vector_store()
+    if not store.external:
+        return []
+    known_ids = set(document.chunks.exclude(vector_id=None).values_list('vector_id', flat=True))
+    return store.find_orphans(document, known_ids, page_size)
+
+
+def delete_vectors(document_id: int = None, point_ids: List[str] = None, batch_size: int = 1000) -> None:
+    """Delete all vectors of a document with one filter, or the given points in batches."""
+    get_vector_store().delete(document_id=document_id, point_ids=point_ids, batch_size=batch_size)
+
+
+def set_payload_user(document_id: int, user_id: int) -> None:
+    """Set the `user_id` payload field on all Qdrant points of a document."""
+    get_qdrant_client().set_payload(
+        collection_name=COLLECTION_NAME,
+        payload={'user_id': user_id},
+        points=models.FilterSelector(
+            filter=models.Filter(
+                must=[models.FieldCondition(
+                    key="document_id",
+                    match=models.MatchValue(value=document_id)
+                )]
+            )
+        )
+    )
+
+
+def strip_payload_content(document_id: int) -> None:
+    """Remove the chunk text from the Qdrant payloads of a document's points."""
+    get_qdrant_client().delete_payload(
+        collection_name=COLLECTION_NAME,
+        keys=['content'],
+        points=models.FilterSelector(
+            filter=models.Filter(
+                must=[models.FieldCondition(
+                    key="document_id",
+                    match=models.MatchValue(value=document_id)
+                )]
+            )
+        )
+    )
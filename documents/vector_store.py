@@ -0,0 +1,311 @@
+from typing import Any, Dict, List, Tuple
+
+from django.conf import settings
+from django.db import connection, transaction
+from pgvector.django import CosineDistance
+from qdrant_client.http import models
+
+from .clients import get_client
+from .metrics import stage
+from .qdrant_client import COLLECTION_NAME, get_qdrant_client
+from .qdrant_schema import search_params
+
+
+def _document_filter(document_id: int) -> models.Filter:
+    return models.Filter(
+        must=[models.FieldCondition(
+            key="document_id",
+            match=models.MatchValue(value=document_id)
+        )]
+    )
+
+
+def _user_filter(user_id: int) -> models.Filter:
+    return models.Filter(
+        must=[models.FieldCondition(
+            key="user_id",
+            match=models.MatchValue(value=user_id)
+        )]
+    )
+
+
+def diversify(hits: List[Dict[str, Any]], documents: int, per_document: int) -> List[Dict[str, Any]]:
+    """Keep ranked hits from at most `documents` documents and at most `per_document` hits from each."""
+    counts = {}
+    kept = []
+    for hit in hits:
+        document_id = hit['document_id']
+        if document_id not in counts and len(counts) >= documents:
+            continue
+        if counts.get(document_id, 0) >= per_document:
+            continue
+        counts[document_id] = counts.get(document_id, 0) + 1
+        kept.append(hit)
+    return kept
+
+
+# Upper bound of hnsw.ef_search
+PGVECTOR_MAX_EF_SEARCH = 1000
+
+
+def _configure_hnsw_scan(candidates: int) -> None:
+    """Size the HNSW scan of the current transaction for `candidates` rows.
+
+    The table holds the chunks of every document, so most index neighbours fail
+    the document or user filter; iterative scans keep going until enough pass.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SET LOCAL hnsw.ef_search = %s',
+            [min(max(settings.PGVECTOR_EF_SEARCH, candidates), PGVECTOR_MAX_EF_SEARCH)]
+        )
+        if settings.PGVECTOR_ITERATIVE_SCAN:
+            cursor.execute('SET LOCAL hnsw.iterative_scan = %s', [settings.PGVECTOR_ITERATIVE_SCAN])
+
+
+class VectorStore:
+    """Where chunk embeddings live and how they are searched.
+
+    `chunks` are unsaved DocumentChunk instances in the same order as their
+    embeddings; search hits are dicts with vector_id, content (None when the
+    backend does not hold the text), chunk_number and distance (cosine
+    similarity, higher is closer).
+    """
+
+    # Whether vectors live outside PostgreSQL and need separate deletes and reconciliation
+    external = True
+
+    def add(self, document, chunks: List, embeddings: List[List[float]]) -> None:
+        raise NotImplementedError
+
+    def search(self, document, query_embedding: List[float], top_k: int) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def search_many(self, document, query_embeddings: List[List[float]], top_k: int) -> List[List[Dict[str, Any]]]:
+        """Run several searches over one document; backends override this to save round trips."""
+        return [self.search(document, embedding, top_k) for embedding in query_embeddings]
+
+    def search_library(self, user_id: int, query_embedding: List[float], documents: int,
+                       per_document: int) -> List[Dict[str, Any]]:
+        """Search all documents of a user, keeping the best `per_document` hits of the best `documents` documents.
+
+        Hits also carry their document_id and are ordered by similarity.
+        """
+        raise NotImplementedError
+
+    def get_vectors(self, document, vector_ids: List[str]) -> Dict[str, List[float]]:
+        raise NotImplementedError
+
+    def renumber(self, moved: List[Tuple[str, int]]) -> None:
+        pass
+
+    def delete(self, document_id: int = None, point_ids: List[str] = None, batch_size: int = 1000) -> None:
+        pass
+
+    def find_orphans(self, document, known_ids: set, page_size: int = 1000) -> List[str]:
+        return []
+
+
+class QdrantVectorStore(VectorStore):
+    """Vectors in the Qdrant collection, one point per chunk keyed by vector_id."""
+
+    def add(self, document, chunks, embeddings):
+        from .utils import chunk_payload  # runtime import to avoid circular import
+
+        points = [
+            models.PointStruct(
+                id=chunk.vector_id,
+                vector=embedding,
+                payload=chunk_payload(document.id, chunk.chunk_number, chunk.content, document.user_id)
+            )
+            for chunk, embedding in zip(chunks, embeddings)
+        ]
+        with stage('qdrant_upsert'):
+            get_qdrant_client().upsert(
+                collection_name=COLLECTION_NAME,
+                points=points
+            )
+
+    def search(self, document, query_embedding, top_k):
+        search_result = get_qdrant_client().search(
+            collection_name=COLLECTION_NAME,
+            query_vector=query_embedding,
+            query_filter=_document_filter(document.id),
+            search_params=search_params(),
+            with_payload=['chunk_number', 'content'],
+            limit=top_k
+        )
+        return self._hits(search_result)
+
+    def search_many(self, document, query_embeddings, top_k):
+        if not query_embeddings:
+            return []
+        document_filter = _document_filter(document.id)
+        results = get_qdrant_client().search_batch(
+            collection_name=COLLECTION_NAME,
+            requests=[
+                models.SearchRequest(
+                    vector=embedding,
+                    filter=document_filter,
+                    params=search_params(),
+                    with_payload=['chunk_number', 'content'],
+                    limit=top_k
+                )
+                for embedding in query_embeddings
+            ]
+        )
+        return [self._hits(search_result) for search_result in results]
+
+    def search_library(self, user_id, query_embedding, documents, per_document):
+        # One filtered search, grouped by document server-side
+        result = get_qdrant_client().search_groups(
+            collection_name=COLLECTION_NAME,
+            query_vector=query_embedding,
+            group_by='document_id',
+            query_filter=_user_filter(user_id),
+            search_params=search_params(),
+            with_payload=['document_id', 'chunk_number', 'content'],
+            limit=documents,
+            group_size=per_document
+        )
+        hits = [hit for group in result.groups for hit in group.hits]
+        return sorted(self._hits(hits, with_document=True), key=lambda hit: hit['distance'], reverse=True)
+
+    @staticmethod
+    def _hits(search_result, with_document: bool = False) -> List[Dict[str, Any]]:
+        return [
+            {
+                'vector_id': str(hit.id),
+                'content': hit.payload.get('content'),
+                'chunk_number': hit.payload['chunk_number'],
+                'distance': hit.score,
+                **({'document_id': hit.payload['document_id']} if with_document else {})
+            }
+            for hit in search_result
+        ]
+
+    def get_vectors(self, document, vector_ids):
+        records = get_qdrant_client().retrieve(
+            collection_name=COLLECTION_NAME,
+            ids=vector_ids,
+            with_payload=False,
+            with_vectors=True
+        )
+        return {str(record.id): record.vector for record in records}
+
+    def renumber(self, moved):
+        get_qdrant_client().batch_update_points(
+            collection_name=COLLECTION_NAME,
+            update_operations=[
+                models.SetPayloadOperation(
+                    set_payload=models.SetPayload(payload={'chunk_number': number}, points=[vector_id])
+                )
+                for vector_id, number in moved
+            ]
+        )
+
+    def delete(self, document_id=None, point_ids=None, batch_size=1000):
+        from .utils import batched  # runtime import to avoid circular import
+
+        if document_id is not None:
+            get_qdrant_client().delete(
+                collection_name=COLLECTION_NAME,
+                points_selector=models.FilterSelector(filter=_document_filter(document_id))
+            )
+        for batch in batched(point_ids or [], batch_size):
+            get_qdrant_client().delete(
+                collection_name=COLLECTION_NAME,
+                points_selector=models.PointIdsList(points=batch)
+            )
+
+    def find_orphans(self, document, known_ids, page_size=1000):
+        orphaned = []
+        offset = None
+        while True:
+            points, offset = get_qdrant_client().scroll(
+                collection_name=COLLECTION_NAME,
+                scroll_filter=_document_filter(document.id),
+                limit=page_size,
+                offset=offset,
+                with_payload=False,
+                with_vectors=False
+            )
+            orphaned.extend(str(point.id) for point in points if str(point.id) not in known_ids)
+            if offset is None:
+                return orphaned
+
+
+class PgVectorStore(VectorStore):
+    """Vectors in the DocumentChunk.embedding column, searched in the same query that reads the text.
+
+    Rows and vectors are written and deleted together, so there is nothing to
+    reconcile and no separate delete.
+    """
+
+    external = False
+
+    def add(self, document, chunks, embeddings):
+        for chunk, embedding in zip(chunks, embeddings):
+            chunk.embedding = embedding
+
+    def search(self, document, query_embedding, top_k):
+        [hits] = self.search_many(document, [query_embedding], top_k)
+        return hits
+
+    def search_many(self, document, query_embeddings, top_k):
+        results = []
+        with transaction.atomic():
+            _configure_hnsw_scan(top_k * 4)
+            for query_embedding in query_embeddings:
+                rows = document.chunks.exclude(embedding=None).annotate(
+                    cosine_distance=CosineDistance('embedding', query_embedding)
+                ).order_by('cosine_distance').values('vector_id', 'content', 'chunk_number', 'cosine_distance')[:top_k]
+                results.append(self._hits(rows))
+        return results
+
+    def search_library(self, user_id, query_embedding, documents, per_document):
+        from .models import DocumentChunk  # runtime import to avoid circular import
+
+        # Nearest chunks across the library, diversified here; several times the
+        # final count so one document's near-duplicates do not crowd out the rest
+        candidates = documents * per_document * 4
+        rows = DocumentChunk.objects.filter(document__user_id=user_id).exclude(embedding=None).annotate(
+            cosine_distance=CosineDistance('embedding', query_embedding)
+        ).order_by('cosine_distance').values(
+            'vector_id', 'content', 'chunk_number', 'document_id', 'cosine_distance'
+        )[:candidates]
+        with transaction.atomic():
+            _configure_hnsw_scan(candidates)
+            hits = self._hits(rows, with_document=True)
+        return diversify(hits, documents, per_document)
+
+    @staticmethod
+    def _hits(rows, with_document: bool = False) -> List[Dict[str, Any]]:
+        hits = [
+            {
+                'vector_id': row['vector_id'],
+                'content': row['content'],
+                'chunk_number': row['chunk_number'],
+                'distance': 1.0 - row['cosine_distance'],
+                **({'document_id': row['document_id']} if with_document else {})
+            }
+            for row in rows
+        ]
+        # relaxed_order iterative scans may return rows slightly out of order
+        return sorted(hits, key=lambda hit: hit['distance'], reverse=True)
+
+    def get_vectors(self, document, vector_ids):
+        rows = document.chunks.filter(vector_id__in=vector_ids).exclude(embedding=None)
+        return {vector_id: [float(x) for x in embedding] for vector_id, embedding in rows.values_list('vector_id', 'embedding')}
+
+
+BACKENDS = {
+    'qdrant': QdrantVectorStore,
+    'pgvector': PgVectorStore,
+}
+
+
+def get_vector_store() -> VectorStore:
+    """Return the vector store selected by VECTOR_BACKEND."""
+    backend = settings.VECTOR_BACKEND
+    return get_client(('vector_store', backend), BACKENDS[backend])
@@ -4,20 +4,36 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django.shortcuts import get_object_or_404
 from .models import Document, Conversation, Message
-from .serializers import DocumentSerializer, ConversationSerializer, MessageSerializer, ChatInputSerializer
-from .tasks import process_document
-from .utils import search_similar_chunks
-from langchain.schema import HumanMessage, AIMessage, SystemMessage
+from .serializers import (
+    DocumentSerializer, DocumentStatusSerializer, ConversationSerializer, MessageSerializer, ChatInputSerializer,
+    BatchChatInputSerializer
+)
+from .tasks import process_document, reprocess_document
+from .utils import (
+    cached_retrieve, compute_file_digest, count_tokens, embed_queries, embed_query, retrieve_chunks_batch,
+    search_library_chunks
+)
+from .answer_cache import answer_cache
+from .prompts import build_prompt
+from . import metrics
+from .clients import get_chat_model
 from django.conf import settings
-from langchain_nvidia_ai_endpoints import ChatNVIDIA
 from django.views.decorators.clickjacking import xframe_options_exempt
-from django.http import FileResponse, Http404
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseForbidden, HttpResponseNotAllowed, JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
 from django.contrib.auth.decorators import login_required
 from django.utils.decorators import method_decorator
 from rest_framework.permissions import IsAuthenticated
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import CursorPagination
 
 
+import asyncio
+import json
+import re
 import time
 import random
 from django.http import StreamingHttpResponse
@@ -30,11 +46,40 @@ class DocumentViewSet(viewsets.ModelViewSet):
         return Document.objects.filter(user=self.request.user)
     
     def perform_create(self, serializer):
-        document = serializer.save()
+        file = serializer.validated_data['file']
+        # file_size routes ingestion to the small or large queue
+        document = serializer.save(digest=compute_file_digest(file), file_size=file.size)
         # Trigger async processing of the document
         Conversation.objects.create(document=document, user=document.user)   
         process_document.delay(document.id)
 
+    def perform_update(self, serializer):
+        file = serializer.validated_data.get('file')
+        if file is None:
+            serializer.save()
+            return
+        digest = compute_file_digest(file)
+        changed = digest != serializer.instance.digest
+        document = serializer.save(digest=digest, file_size=file.size)
+        if changed:
+            # A new file version only re-embeds the chunks that changed
+            reprocess_document.delay(document.id)
+
+    @action(detail=True, methods=['get'], url_path='status')
+    def progress(self, request, pk=None):
+        """Ingestion status and progress; cheap enough to poll."""
+        document = get_object_or_404(
+            self.get_queryset().only('id', 'status', 'chunks_done', 'chunks_total', 'error'),
+            pk=pk
+        )
+        return Response(DocumentStatusSerializer(document).data)
+
+    @action(detail=True, methods=['post'])
+    def reprocess(self, request, pk=None):
+        document = self.get_object()
+        reprocess_document.delay(document.id)
+        return Response({'status': 'queued'}, status=status.HTTP_202_ACCEPTED)
+
 @xframe_options_exempt
 @login_required
 def serve_pdf(request, pk):
@@ -45,10 +90,19 @@ def serve_pdf(request, pk):
         raise Http404("Document not found or you don't have permission.")
     
 
-class MessagePagination(PageNumberPagination):
+def metrics_view(request):
+    """Expose ingestion and chat metrics in the Prometheus text format."""
+    if settings.METRICS_TOKEN and request.headers.get('Authorization') != f"Bearer {settings.METRICS_TOKEN}":
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+    
+
+class MessagePagination(CursorPagination):
+    """Keyset pagination, newest first; pages cost the same at any depth and no COUNT(*) is run."""
     page_size = 20
     page_size_query_param = 'page_size'
     max_page_size = 100
+    ordering = '-created_at'
 
 
 
@@ -66,6 +120,48 @@ def random_message_stream():
 
 
 
+CHAT_MODEL = 'meta/llama3-8b-instruct'
+CHAT_PARAMS = {'temperature': 0.7, 'max_tokens': 1024}
+SYSTEM_PROMPT = (
+    "You are a helpful AI assistant that answers questions about the document. "
+    "Use the provided context to answer questions accurately. "
+    "If you're unsure or the answer isn't in the context, say so."
+)
+
+
+def split_for_stream(text):
+    """Split a cached answer into word-sized pieces so it streams like a live response."""
+    return re.findall(r'\S+\s*|\s+', text)
+
+
+def library_context(chunks):
+    """Label library hits with their document so the model can tell the sources apart."""
+    return [{**chunk, 'content': f"[{chunk['document_title']}]\n{chunk['content']}"} for chunk in chunks]
+
+
+def retrieve_context(conversation, query, query_embedding=None):
+    """Embed a query and retrieve its context chunks in the conversation's scope."""
+    if conversation.scope == 'library':
+        query_embedding = query_embedding or embed_query(query)
+        chunks = search_library_chunks(query, conversation.user_id, query_embedding=query_embedding)
+        return query_embedding, library_context(chunks)
+    return cached_retrieve(query, conversation.document, top_k=settings.PROMPT_CANDIDATE_CHUNKS)
+
+
+def iter_async(agen):
+    """Drive an async generator from sync code, such as a StreamingHttpResponse body, on a private event loop."""
+    loop = asyncio.new_event_loop()
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(agen.__anext__())
+            except StopAsyncIteration:
+                return
+    finally:
+        loop.run_until_complete(agen.aclose())
+        loop.close()
+
+
 class ConversationViewSet(viewsets.ModelViewSet):
     serializer_class = ConversationSerializer
     permission_classes = [IsAuthenticated]
@@ -78,9 +174,19 @@ class ConversationViewSet(viewsets.ModelViewSet):
     def messages(self, request, pk=None):
         conversation = self.get_object()
         paginator = MessagePagination()
-        messages = conversation.messages.all().order_by('-created_at')
+        messages = Message.objects.filter(conversation=conversation)
+        # e.g. ?fields=role,content; created_at is always loaded for the cursor
+        fields = [name.strip() for name in request.query_params.get('fields', '').split(',') if name.strip()] or None
+        if fields:
+            unknown = [name for name in fields if name not in MessageSerializer.Meta.fields]
+            if unknown:
+                return Response(
+                    {'fields': [f"Unknown fields: {', '.join(unknown)}. Choose from: {', '.join(MessageSerializer.Meta.fields)}."]},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            messages = messages.only(*{'id', 'created_at', *fields})
         page = paginator.paginate_queryset(messages, request)
-        serializer = MessageSerializer(page, many=True)
+        serializer = MessageSerializer(page, many=True, fields=fields)
         return paginator.get_paginated_response(serializer.data)
     
     @action(detail=True, methods=['post'], serializer_class=ChatInputSerializer)
@@ -98,53 +204,58 @@ class ConversationViewSet(viewsets.ModelViewSet):
             content=message_content
         )
         
-        similar_chunks = search_similar_chunks(
-            query=message_content,
-            document=conversation.document,
-            top_k=3
-        )
+        started = time.perf_counter()
+        query_embedding, similar_chunks = retrieve_context(conversation, message_content)
+        retrieval_seconds = time.perf_counter() - started
         
-        messages = []
-        system_prompt = (
-            "You are a helpful AI assistant that answers questions about the document. "
-            "Use the provided context to answer questions accurately. "
-            "If you're unsure or the answer isn't in the context, say so."
-        )
-        messages.append(SystemMessage(content=system_prompt))
-        context = '\n\n'.join([chunk['content'] for chunk in similar_chunks])
-        context_prompt = f"Context from the document:\n{context}"
-        messages.append(SystemMessage(content=context_prompt))
-        
-        history = conversation.messages.order_by('-created_at')[:5][::-1]
-        for msg in history:
-            if msg.role == 'user':
-                messages.append(HumanMessage(content=msg.content))
-            elif msg.role == 'assistant':
-                messages.append(AIMessage(content=msg.content))
+        history = conversation.messages.order_by('-created_at')[:settings.PROMPT_HISTORY_MESSAGES][::-1]
+        prompt = build_prompt(SYSTEM_PROMPT, similar_chunks, history)
+        chunk_ids = [chunk['vector_id'] for chunk in prompt.chunks]
+        # Answers are cached per document; library answers are not cached
+        cached_answer = None
+        if conversation.document_id is not None:
+            cached_answer = answer_cache.lookup(conversation.document_id, query_embedding, chunk_ids)
         
         def stream_response():
             try:
-                chat = ChatNVIDIA(
-                    model='meta/llama3-8b-instruct',
-                    temperature=0.7,
-                    max_tokens=1024,
-                    base_url="https://integrate.api.nvidia.com/v1", 
-                    api_key=settings.NVIDIA_API_KEY 
-                )
+                if cached_answer is not None:
+                    metrics.record_chat(retrieval_seconds, time.perf_counter() - started, cached=True)
+                    for piece in split_for_stream(cached_answer):
+                        yield f"data: {piece}\n\n"
+                    Message.objects.create(
+                        conversation=conversation,
+                        role='assistant',
+                        content=cached_answer
+                    )
+                    return
+
+                chat = get_chat_model(CHAT_MODEL, **CHAT_PARAMS)
 
                 full_content = ""
+                first_token_at = None
 
-                for chunk in chat.stream(messages):
+                for chunk in chat.stream(prompt.messages):
                     content = chunk.content  # Extract text from chunk
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
                     full_content += content
                     yield f"data: {content}\n\n"
-                    time.sleep(0.05)
 
+                finished_at = time.perf_counter()
                 Message.objects.create(
                     conversation=conversation,
                     role='assistant',
                     content=full_content
                 )
+                if conversation.document_id is not None:
+                    answer_cache.store(conversation.document_id, query_embedding, chunk_ids, full_content)
+                metrics.record_chat(
+                    retrieval_seconds,
+                    first_token_at - started if first_token_at else None,
+                    completion_tokens=count_tokens(full_content),
+                    generation_seconds=finished_at - (first_token_at or finished_at),
+                    prompt_tokens=prompt.tokens
+                )
 
             except Exception as e:
                 yield f"data: [ERROR] AI API error: {str(e)}\n\n"
@@ -153,4 +264,241 @@ class ConversationViewSet(viewsets.ModelViewSet):
         response['Cache-Control'] = 'no-cache'
         response['X-Accel-Buffering'] = 'no'  # Disable buffering for nginx
         
-        return response
\ No newline at end of file
+        return response
+
+    @action(detail=True, methods=['post'], url_path='batch-chat', serializer_class=BatchChatInputSerializer)
+    def batch_chat(self, request, pk=None):
+        """Answer a list of questions about the conversation's document (or library) in one request.
+
+        Questions are answered independently of each other and of earlier
+        turns. They are embedded concurrently and searched in one batch;
+        LLM calls run concurrently, at most CHAT_BATCH_CONCURRENCY at a time.
+        Answers stream back as NDJSON in completion order, each line carrying
+        the question's index, followed by a summary line.
+        """
+        conversation = self.get_object()
+        serializer = BatchChatInputSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        questions = serializer.validated_data['questions']
+        document = conversation.document
+
+        started = time.perf_counter()
+        query_embeddings = embed_queries(questions)
+        if document is None:
+            retrieved = [
+                retrieve_context(conversation, question, query_embedding)[1]
+                for question, query_embedding in zip(questions, query_embeddings)
+            ]
+        else:
+            retrieved = retrieve_chunks_batch(
+                questions, document, top_k=settings.PROMPT_CANDIDATE_CHUNKS, query_embeddings=query_embeddings
+            )
+        retrieval_seconds = (time.perf_counter() - started) / len(questions)
+
+        prompts, chunk_ids, answers = [], [], {}
+        for index, (question, chunks) in enumerate(zip(questions, retrieved)):
+            prompt = build_prompt(SYSTEM_PROMPT, chunks, [Message(role='user', content=question)])
+            prompts.append(prompt)
+            chunk_ids.append([chunk['vector_id'] for chunk in prompt.chunks])
+            if document is None:
+                continue
+            cached_answer = answer_cache.lookup(document.id, query_embeddings[index], chunk_ids[index])
+            if cached_answer is not None:
+                answers[index] = cached_answer
+                metrics.record_chat(retrieval_seconds, None, cached=True)
+
+        async def generate():
+            chat = get_chat_model(CHAT_MODEL, **CHAT_PARAMS)
+            semaphore = asyncio.Semaphore(settings.CHAT_BATCH_CONCURRENCY)
+
+            async def answer(index):
+                async with semaphore:
+                    generation_started = time.perf_counter()
+                    try:
+                        reply = await chat.ainvoke(prompts[index].messages)
+                    except Exception as e:
+                        return index, None, str(e), 0.0
+                    return index, reply.content, None, time.perf_counter() - generation_started
+
+            pending = [asyncio.ensure_future(answer(index)) for index in range(len(questions)) if index not in answers]
+            try:
+                for next_answer in asyncio.as_completed(pending):
+                    yield await next_answer
+            finally:
+                # The client went away: stop the LLM calls still running
+                for task in pending:
+                    task.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+
+        def line(data):
+            return json.dumps(data) + '\n'
+
+        def save_messages():
+            # Questions and answers are saved in question order, unanswered questions without a reply
+            messages = []
+            for index, question in enumerate(questions):
+                messages.append(Message(conversation=conversation, role='user', content=question))
+                if index in answers:
+                    messages.append(Message(conversation=conversation, role='assistant', content=answers[index]))
+            Message.objects.bulk_create(messages)
+
+        def stream_response():
+            failed = 0
+            generated = iter_async(generate())
+            try:
+                for index, content in answers.items():
+                    yield line({'index': index, 'question': questions[index], 'answer': content,
+                                'chunk_ids': chunk_ids[index], 'cached': True})
+
+                for index, content, error, generation_seconds in generated:
+                    if error is not None:
+                        failed += 1
+                        yield line({'index': index, 'question': questions[index], 'error': f"AI API error: {error}"})
+                        continue
+                    answers[index] = content
+                    yield line({'index': index, 'question': questions[index], 'answer': content,
+                                'chunk_ids': chunk_ids[index], 'cached': False})
+                    if document is not None:
+                        answer_cache.store(document.id, query_embeddings[index], chunk_ids[index], content)
+                    metrics.record_chat(
+                        retrieval_seconds,
+                        None,
+                        completion_tokens=count_tokens(content),
+                        generation_seconds=generation_seconds,
+                        prompt_tokens=prompts[index].tokens
+                    )
+            finally:
+                # Also reached when the client disconnects: the answers that arrived are kept
+                generated.close()
+                save_messages()
+            yield line({'done': True, 'answered': len(answers), 'failed': failed})
+
+        response = StreamingHttpResponse(stream_response(), content_type='application/x-ndjson')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'  # Disable buffering for nginx
+
+        return response
+
+
+def in_worker_thread(function):
+    """Wrap blocking, network-bound `function` for async views.
+
+    It runs on a pool thread rather than the one thread that thread-sensitive
+    calls such as the ORM share, so concurrent requests do not queue behind
+    each other's embedding, Qdrant and Redis round trips. Database connections
+    the pool thread opened are closed as at the end of a request.
+    """
+    def run(*args, **kwargs):
+        try:
+            return function(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    return sync_to_async(run, thread_sensitive=False)
+
+
+async def _authenticate(request):
+    try:
+        result = await sync_to_async(JWTAuthentication().authenticate)(request)
+    except AuthenticationFailed:
+        return None
+    return result[0] if result else None
+
+
+@csrf_exempt
+async def chat_stream(request, pk):
+    """Async variant of ConversationViewSet.chat for ASGI deployments.
+
+    Tokens are streamed with `astream`, so a waiting response does not hold a
+    worker thread for the length of the LLM answer.
+    """
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+
+    user = await _authenticate(request)
+    if user is None:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=status.HTTP_401_UNAUTHORIZED)
+
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        return JsonResponse({'detail': 'Invalid JSON.'}, status=status.HTTP_400_BAD_REQUEST)
+    serializer = ChatInputSerializer(data=data)
+    if not serializer.is_valid():
+        return JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        conversation = await Conversation.objects.select_related('document').aget(pk=pk, user=user)
+    except Conversation.DoesNotExist:
+        raise Http404("Conversation not found.")
+
+    message_content = serializer.validated_data['message']
+
+    await Message.objects.acreate(
+        conversation=conversation,
+        role='user',
+        content=message_content
+    )
+
+    started = time.perf_counter()
+    query_embedding, similar_chunks = await in_worker_thread(retrieve_context)(conversation, message_content)
+    retrieval_seconds = time.perf_counter() - started
+
+    history = [msg async for msg in conversation.messages.order_by('-created_at')[:settings.PROMPT_HISTORY_MESSAGES]][::-1]
+    prompt = build_prompt(SYSTEM_PROMPT, similar_chunks, history)
+    chunk_ids = [chunk['vector_id'] for chunk in prompt.chunks]
+    cached_answer = None
+    if conversation.document_id is not None:
+        cached_answer = await in_worker_thread(answer_cache.lookup)(conversation.document_id, query_embedding, chunk_ids)
+
+    async def stream_response():
+        try:
+            if cached_answer is not None:
+                await in_worker_thread(metrics.record_chat)(retrieval_seconds, time.perf_counter() - started, cached=True)
+                for piece in split_for_stream(cached_answer):
+                    yield f"data: {piece}\n\n"
+                await Message.objects.acreate(
+                    conversation=conversation,
+                    role='assistant',
+                    content=cached_answer
+                )
+                return
+
+            chat = get_chat_model(CHAT_MODEL, **CHAT_PARAMS)
+
+            full_content = ""
+            first_token_at = None
+
+            async for chunk in chat.astream(prompt.messages):
+                content = chunk.content
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                full_content += content
+                yield f"data: {content}\n\n"
+
+            finished_at = time.perf_counter()
+            await Message.objects.acreate(
+                conversation=conversation,
+                role='assistant',
+                content=full_content
+            )
+            if conversation.document_id is not None:
+                await in_worker_thread(answer_cache.store)(conversation.document_id, query_embedding, chunk_ids, full_content)
+            await in_worker_thread(metrics.record_chat)(
+                retrieval_seconds,
+                first_token_at - started if first_token_at else None,
+                completion_tokens=count_tokens(full_content),
+                generation_seconds=finished_at - (first_token_at or finished_at),
+                prompt_tokens=prompt.tokens
+            )
+
+        except Exception as e:
+            yield f"data: [ERROR] AI API error: {str(e)}\n\n"
+
+    response = StreamingHttpResponse(stream_response(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Disable buffering for nginx
+
+    return response